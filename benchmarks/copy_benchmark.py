@@ -0,0 +1,260 @@
+# Copyright (c) 2017 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Micro-benchmark of the copy backend of the Nuke file publish plugin.
+
+Copies a set of synthetic frames between two folders with each combination of
+copy method, block size and read-ahead, using the same functions as the
+publish plugin, and reports the throughput of each. Point the folders at the
+storage tiers to tune the "Copy Block Size", "Use Sendfile", "Copy Read
+Ahead", "Sync Copies" and "Transfer Mode" settings for::
+
+    python benchmarks/copy_benchmark.py --source-dir /mnt/work --dest-dir /mnt/publish \\
+        --files 20 --file-size 200 --sync
+
+The methods are:
+
+- read: the regular copy, reading the data in blocks ("Use Sendfile" off)
+- sendfile: the regular copy, copied by the kernel ("Use Sendfile" on)
+- copy_file_range: the copy_file_range transfer mode (block size unused)
+- reflink: the reflink transfer mode (block size unused)
+
+The source files are evicted from the page cache before each run where the
+platform allows it, so that the reads hit the storage.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import publish_benchmark
+
+logger = logging.getLogger("copy_benchmark")
+
+METHODS = ["read", "sendfile", "copy_file_range", "reflink"]
+
+
+def generate_files(folder, count, size):
+    """
+    Write the source files of the benchmark, flushed to the storage.
+    """
+    block = os.urandom(min(size, 1024 * 1024))
+    paths = []
+    for index in range(count):
+        path = os.path.join(folder, "frame.%04d.exr" % (index + 1,))
+        with open(path, "wb") as frame_file:
+            remaining = size
+            while remaining > 0:
+                frame_file.write(block[:remaining])
+                remaining -= len(block)
+            frame_file.flush()
+            os.fsync(frame_file.fileno())
+        paths.append(path)
+    return paths
+
+
+def evict(paths):
+    """
+    Drop the supplied files from the page cache, where supported.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def run_copy(publish_file, method, block_size, read_ahead, sources, dest_folder):
+    """
+    Copy the sources to the destination folder with the supplied method.
+    """
+    for source in sources:
+        destination = os.path.join(dest_folder, os.path.basename(source))
+        if method in ("read", "sendfile"):
+            publish_file._copy_data(
+                source,
+                destination,
+                block_size,
+                use_sendfile=method == "sendfile",
+                read_ahead=read_ahead,
+            )
+        else:
+            publish_file._transfer_file(method, source, destination)
+
+
+def run_benchmark(args, source_folder, dest_folder):
+    nuke_module = publish_benchmark.make_nuke_module([], 1, 1)
+    sgtk = publish_benchmark.install_stub_modules(
+        nuke_module, publish_benchmark.StubEngine({})
+    )
+    publish_file = publish_benchmark.load_hook(
+        sgtk, "publish_file.py", publish_benchmark.StubHook
+    )
+
+    logger.info(
+        "Generating %s files of %s bytes in %s..."
+        % (args.files, args.file_size, source_folder)
+    )
+    sources = generate_files(source_folder, args.files, args.file_size)
+    total_bytes = args.files * args.file_size
+
+    results = []
+    for method in args.methods:
+        if method in ("read", "sendfile"):
+            (block_sizes, read_aheads) = (args.block_sizes, args.read_ahead)
+        else:
+            # the kernel does all the work
+            (block_sizes, read_aheads) = ([None], [None])
+        for block_size in block_sizes:
+            for read_ahead in read_aheads:
+                run_folder = tempfile.mkdtemp(prefix="run_", dir=dest_folder)
+                evict(sources)
+                start = time.time()
+                try:
+                    run_copy(
+                        publish_file,
+                        method,
+                        (block_size or 1024) * 1024,
+                        bool(read_ahead),
+                        sources,
+                        run_folder,
+                    )
+                except (IOError, OSError) as e:
+                    logger.info("%s is not supported here: %s" % (method, e))
+                    shutil.rmtree(run_folder, ignore_errors=True)
+                    break
+                copy_seconds = time.time() - start
+
+                sync_seconds = None
+                if args.sync:
+                    start = time.time()
+                    publish_file._sync_files(
+                        [
+                            os.path.join(run_folder, os.path.basename(source))
+                            for source in sources
+                        ]
+                    )
+                    sync_seconds = time.time() - start
+
+                shutil.rmtree(run_folder, ignore_errors=True)
+                results.append(
+                    {
+                        "method": method,
+                        "block_size": block_size,
+                        "read_ahead": read_ahead,
+                        "copy_seconds": copy_seconds,
+                        "sync_seconds": sync_seconds,
+                        "mb_per_second": (
+                            total_bytes
+                            / (1024.0 * 1024.0)
+                            / (copy_seconds + (sync_seconds or 0.0))
+                        ),
+                    }
+                )
+    return results
+
+
+def print_results(results):
+    print(
+        "%-16s %8s %10s %10s %10s %10s"
+        % ("method", "block KB", "read ahead", "copy s", "sync s", "MB/s")
+    )
+    for result in results:
+        print(
+            "%-16s %8s %10s %10.3f %10s %10.1f"
+            % (
+                result["method"],
+                result["block_size"] or "-",
+                {True: "on", False: "off", None: "-"}[result["read_ahead"]],
+                result["copy_seconds"],
+                "-"
+                if result["sync_seconds"] is None
+                else "%.3f" % (result["sync_seconds"],),
+                result["mb_per_second"],
+            )
+        )
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=10, help="Number of files")
+    parser.add_argument(
+        "--file-size", type=float, default=50.0, help="Size of each file in MB"
+    )
+    parser.add_argument(
+        "--source-dir", help="Folder to create the source files in (default: temp)"
+    )
+    parser.add_argument(
+        "--dest-dir", help="Folder to copy the files to (default: temp)"
+    )
+    parser.add_argument(
+        "--methods",
+        type=parse_list,
+        default=METHODS,
+        help="Comma separated methods to measure (default: %s)" % (",".join(METHODS),),
+    )
+    parser.add_argument(
+        "--block-sizes",
+        type=lambda value: [int(size) for size in parse_list(value)],
+        default=[64, 256, 1024, 4096, 16384],
+        help="Comma separated block sizes in KB",
+    )
+    parser.add_argument(
+        "--no-read-ahead",
+        action="store_const",
+        const=[True, False],
+        default=[True],
+        dest="read_ahead",
+        help="Also measure the copies without read-ahead advice",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Include the batched sync of the copied files in the measure",
+    )
+    parser.add_argument("--json", help="Write the results to this json file")
+    args = parser.parse_args(argv)
+    args.file_size = int(args.file_size * 1024 * 1024)
+
+    unknown_methods = set(args.methods) - set(METHODS)
+    if unknown_methods:
+        parser.error("Unknown methods: %s" % (", ".join(sorted(unknown_methods)),))
+
+    logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+
+    source_folder = tempfile.mkdtemp(prefix="copy_benchmark_", dir=args.source_dir)
+    dest_folder = tempfile.mkdtemp(prefix="copy_benchmark_", dir=args.dest_dir)
+    try:
+        results = run_benchmark(args, source_folder, dest_folder)
+    finally:
+        shutil.rmtree(source_folder, ignore_errors=True)
+        shutil.rmtree(dest_folder, ignore_errors=True)
+
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,953 @@
+# Copyright (c) 2017 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Offline benchmark of the Nuke publish hooks.
+
+Runs the collector -> accept -> validate -> publish -> finalize phases of the
+hooks in ``hooks/tk-multi-publish2/basic/nuke`` against in-process stand-ins
+for ``sgtk``, ``nuke`` and the Shotgun API, on synthetic EXR sequences
+generated on local disk. No Shotgun site or Nuke licence is required.
+
+Reports the wall time of each phase, the number of Shotgun calls made during
+each phase and the copy throughput::
+
+    python benchmarks/publish_benchmark.py --items 8 --frames 500 --frame-size 2
+
+Plugin settings can be overridden with ``--setting "Name=value"``, where the
+value is parsed as json when possible::
+
+    python benchmarks/publish_benchmark.py --setting "Copy Workers=1"
+
+The stand-ins only implement what the hooks use. They don't attempt to mimic
+the latency of a real Shotgun site, so use the call counts to reason about
+round-trips.
+"""
+
+import argparse
+import collections
+import importlib.util
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+HOOKS_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "hooks",
+    "tk-multi-publish2",
+    "basic",
+    "nuke",
+)
+
+WORK_DEFINITION = (
+    "work/{Shot}/elements/{nuke.output}/v{version}/"
+    "{Shot}_{nuke.output}_v{version}.{SEQ}.exr"
+)
+PUBLISH_DEFINITION = (
+    "publish/{Shot}/elements/{nuke.output}/v{version}/"
+    "{Shot}_{nuke.output}_v{version}.{SEQ}.exr"
+)
+
+# minimal EXR header so the synthetic frames look like images to any tool
+EXR_MAGIC = b"\x76\x2f\x31\x01\x02\x00\x00\x00"
+
+# The filter relations and operators supported by StubShotgun
+FILTER_RELATIONS = {
+    "is": lambda entity_value, value: entity_value == value,
+    "is_not": lambda entity_value, value: entity_value != value,
+    "in": lambda entity_value, value: entity_value in value,
+    "not_in": lambda entity_value, value: entity_value not in value,
+    "starts_with": lambda entity_value, value: (entity_value or "").startswith(value),
+    "ends_with": lambda entity_value, value: (entity_value or "").endswith(value),
+    "contains": lambda entity_value, value: value in (entity_value or ""),
+    "not_contains": lambda entity_value, value: value not in (entity_value or ""),
+}
+FILTER_OPERATORS = {"all": all, "and": all, "any": any, "or": any}
+
+logger = logging.getLogger("publish_benchmark")
+
+
+################################################################################
+# Shotgun stand-in
+
+
+class StubShotgun(object):
+    """
+    In memory stand-in for the Shotgun API connection, counting calls.
+    """
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self._entities = {}
+        self._next_id = 1
+
+    def create(self, entity_type, data, return_fields=None):
+        self.calls["create"] += 1
+        entity = dict(data, type=entity_type, id=self._next_id)
+        self._next_id += 1
+        self._entities[(entity_type, entity["id"])] = entity
+        return dict(entity)
+
+    def update(self, entity_type, entity_id, data):
+        self.calls["update"] += 1
+        self._entities[(entity_type, entity_id)].update(data)
+        return dict(self._entities[(entity_type, entity_id)])
+
+    def find(self, entity_type, filters, fields=None, filter_operator=None, **kwargs):
+        self.calls["find"] += 1
+        return [
+            dict(entity)
+            for ((e_type, _), entity) in sorted(self._entities.items())
+            if e_type == entity_type
+            and self._matches(entity, filters, filter_operator or "all")
+        ]
+
+    def find_one(
+        self, entity_type, filters, fields=None, filter_operator=None, **kwargs
+    ):
+        self.calls["find_one"] += 1
+        entities = self.find(entity_type, filters, fields, filter_operator)
+        self.calls["find"] -= 1
+        return entities[0] if entities else None
+
+    def batch(self, requests):
+        self.calls["batch"] += 1
+        results = []
+        for request in requests:
+            if request["request_type"] == "update":
+                results.append(
+                    self.update(
+                        request["entity_type"], request["entity_id"], request["data"]
+                    )
+                )
+                self.calls["update"] -= 1
+            elif request["request_type"] == "create":
+                results.append(self.create(request["entity_type"], request["data"]))
+                self.calls["create"] -= 1
+        return results
+
+    def upload(self, entity_type, entity_id, path, field_name=None, **kwargs):
+        self.calls["upload"] += 1
+
+    def upload_thumbnail(self, entity_type, entity_id, path, **kwargs):
+        self.calls["upload_thumbnail"] += 1
+
+    def _matches(self, entity, filters, operator="all"):
+        """
+        Return whether the entity matches the supplied filters, combined with
+        the supplied filter operator. Nested filter groups are dictionaries of
+        "filter_operator" and "filters", like with the Shotgun API.
+        """
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(
+                "StubShotgun doesn't support the '%s' filter operator. Supported "
+                "operators: %s" % (operator, ", ".join(sorted(FILTER_OPERATORS)))
+            )
+
+        results = []
+        for condition in filters:
+            if isinstance(condition, dict):
+                results.append(
+                    self._matches(
+                        entity, condition["filters"], condition["filter_operator"]
+                    )
+                )
+                continue
+            field, relation, value = condition
+            if relation not in FILTER_RELATIONS:
+                raise ValueError(
+                    "StubShotgun doesn't support the '%s' relation of the filter "
+                    "%r. Supported relations: %s"
+                    % (relation, condition, ", ".join(sorted(FILTER_RELATIONS)))
+                )
+            entity_value = filter_value(entity.get(field), field)
+            if relation in ("in", "not_in"):
+                value = [filter_value(item, field) for item in value]
+            else:
+                value = filter_value(value, field)
+            results.append(FILTER_RELATIONS[relation](entity_value, value))
+        return FILTER_OPERATORS[operator](results)
+
+
+def filter_value(value, field):
+    """
+    Return the value compared by a filter: the (type, id) of an entity link
+    and the local path of a file path.
+    """
+    if isinstance(value, dict):
+        if field == "path" and "local_path" in value:
+            return value["local_path"]
+        if "type" in value and "id" in value:
+            return (value["type"], value["id"])
+    return value
+
+
+################################################################################
+# sgtk stand-ins
+
+
+class StubTemplate(object):
+    """
+    Minimal template supporting string keys, ``version`` and ``SEQ``.
+    """
+
+    _INT_KEYS = {"version": "%03d", "SEQ": "%04d"}
+
+    def __init__(self, name, root, definition):
+        self.name = name
+        self.definition = os.path.join(root, definition)
+        self.keys = sorted(set(re.findall(r"{([^}]+)}", self.definition)))
+
+        pattern = ""
+        seen_keys = set()
+        for index, token in enumerate(re.split(r"({[^}]+})", self.definition)):
+            if index % 2 == 0:
+                pattern += re.escape(token)
+                continue
+            key = token[1:-1]
+            group_name = key.replace(".", "__")
+            if key in seen_keys:
+                pattern += "(?P=%s)" % (group_name,)
+                continue
+            seen_keys.add(key)
+            if key == "SEQ":
+                # frame numbers or a frame specifier such as %04d
+                value_pattern = r"\d+|%0\d+d"
+            elif key in self._INT_KEYS:
+                value_pattern = r"\d+"
+            else:
+                value_pattern = r"[^/_.]+"
+            pattern += "(?P<%s>%s)" % (group_name, value_pattern)
+        self._regex = re.compile(pattern + "$")
+
+    def __repr__(self):
+        return "<Sgtk TemplatePath %s: %s>" % (self.name, self.definition)
+
+    def validate(self, path):
+        return bool(self._regex.match(path))
+
+    def get_fields(self, path):
+        match = self._regex.match(path)
+        if not match:
+            raise ValueError("%s does not match %s" % (path, self))
+        fields = {}
+        for group, value in match.groupdict().items():
+            key = group.replace("__", ".")
+            fields[key] = int(value) if value.isdigit() else value
+        return fields
+
+    def missing_keys(self, fields, skip_defaults=False):
+        return [key for key in self.keys if key not in fields]
+
+    def apply_fields(self, fields):
+        path = self.definition
+        for key in self.keys:
+            value = fields[key]
+            if key in self._INT_KEYS:
+                if isinstance(value, str):
+                    # a frame specifier, either as is or as "FORMAT: %d"
+                    if value.startswith("FORMAT:"):
+                        value = self._INT_KEYS[key]
+                else:
+                    value = self._INT_KEYS[key] % (value,)
+            path = path.replace("{%s}" % (key,), str(value))
+        return path
+
+
+class StubSetting(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class PublishData(dict):
+    """
+    Dictionary with attribute access, like the publisher's PublishData.
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+class StubItem(object):
+    """
+    Stand-in for the publisher's PublishItem.
+    """
+
+    def __init__(self, name, type_spec, type_display, parent, context):
+        self.name = name
+        self.type_spec = type_spec
+        self.type_display = type_display
+        self.parent = parent
+        self.context = context
+        self.children = []
+        self.checked = True
+        self.description = "Benchmark publish"
+        self.thumbnail_enabled = False
+        self.properties = PublishData()
+        self._local_properties = collections.defaultdict(PublishData)
+        self.current_plugin = None
+        if parent:
+            parent.children.append(self)
+
+    @property
+    def local_properties(self):
+        return self._local_properties[self.current_plugin]
+
+    def create_item(self, type_spec, type_display, name):
+        return StubItem(name, type_spec, type_display, self, self.context)
+
+    def set_icon_from_path(self, path):
+        pass
+
+    def set_thumbnail_from_path(self, path):
+        pass
+
+    def get_property(self, name, default_value=None):
+        if name in self.local_properties:
+            return self.local_properties[name]
+        return self.properties.get(name, default_value)
+
+    def get_thumbnail_as_path(self):
+        return None
+
+    @property
+    def descendants(self):
+        for child in self.children:
+            yield child
+            for descendant in child.descendants:
+                yield descendant
+
+
+class StubContext(object):
+    project = {"type": "Project", "id": 1, "name": "Benchmark"}
+    entity = {"type": "Shot", "id": 2, "code": "sh010"}
+    task = {"type": "Task", "id": 3, "content": "comp"}
+    step = None
+    user = None
+
+
+class StubPublisherUtil(object):
+    """
+    Stand-in for the publisher's util module.
+    """
+
+    def __init__(self, publisher):
+        self._publisher = publisher
+
+    def get_file_path_components(self, path):
+        folder, filename = os.path.split(path)
+        extension = os.path.splitext(filename)[1].lstrip(".")
+        return {
+            "path": path,
+            "folder": folder,
+            "filename": filename,
+            "extension": extension,
+        }
+
+    def get_publish_name(self, path, sequence=False):
+        return os.path.basename(path)
+
+    def get_version_number(self, path):
+        match = re.search(r"_v(\d+)", path)
+        return int(match.group(1)) if match else None
+
+    def get_next_version_path(self, path):
+        version = self.get_version_number(path)
+        if version is None:
+            return None
+        return re.sub(r"_v\d+", "_v%03d" % (version + 1,), path)
+
+    def get_frame_sequence_path(self, path, frame_spec=None):
+        return re.sub(r"\.\d+\.", ".%04d.", path)
+
+    def get_conflicting_publishes(self, context, path, publish_name, filters=None):
+        publish_data = register_publish(
+            self._publisher.sgtk, context, path, publish_name, dry_run=True
+        )
+        publish_filters = [filters] if filters else []
+        for field in ["code", "entity", "name", "project", "task"]:
+            publish_filters.append([field, "is", publish_data[field]])
+        publishes = self._publisher.shotgun.find("PublishedFile", publish_filters)
+
+        # like the util, only keep the publishes of the same path
+        path = ShotgunPath.normalize(path)
+        matching_publishes = []
+        for publish in publishes:
+            publish_path = resolve_publish_path(self._publisher.sgtk, publish)
+            if ShotgunPath.normalize(publish_path) == path:
+                matching_publishes.append(publish)
+        return matching_publishes
+
+    def clear_status_for_conflicting_publishes(self, context, publish_data):
+        publishes = self.get_conflicting_publishes(
+            context,
+            publish_data["path"]["local_path"],
+            publish_data["name"],
+            filters=["sg_status_list", "is_not", None],
+        )
+        batch_data = [
+            {
+                "request_type": "update",
+                "entity_type": "PublishedFile",
+                "entity_id": publish["id"],
+                "data": {"sg_status_list": None},
+            }
+            for publish in publishes
+            if publish["id"] != publish_data["id"]
+        ]
+        if batch_data:
+            self._publisher.shotgun.batch(batch_data)
+
+
+class StubTk(object):
+    def __init__(self, shotgun):
+        self.shotgun = shotgun
+
+
+class StubEngine(object):
+    def __init__(self, templates):
+        self._templates = templates
+        self.apps = {}
+        self.name = "tk-nuke"
+
+    def get_template_by_name(self, name):
+        return self._templates.get(name)
+
+
+class StubPublisher(object):
+    """
+    Stand-in for the tk-multi-publish2 app.
+    """
+
+    def __init__(self, engine, disk_location):
+        self.shotgun = StubShotgun()
+        self.sgtk = StubTk(self.shotgun)
+        self.engine = engine
+        self.context = StubContext()
+        self.disk_location = disk_location
+        self.util = StubPublisherUtil(self)
+
+    def ensure_folder_exists(self, folder):
+        ensure_folder_exists(folder)
+
+    def get_setting(self, name, default=None):
+        return default
+
+    def create_hook_instance(self, hook_expression, base_class=None):
+        # the hooks referenced by the plugin settings live next to the plugins
+        file_name = os.path.basename(hook_expression.split(":")[-1])
+        module = load_hook(sys.modules["sgtk"], file_name, base_class or StubHook)
+        hook_classes = [
+            value
+            for value in vars(module).values()
+            if isinstance(value, type)
+            and issubclass(value, StubHook)
+            and value.__module__ == module.__name__
+        ]
+        return hook_classes[0](self)
+
+
+def register_publish(
+    tk, context, path, name, version_number=None, dry_run=False, **kwargs
+):
+    """
+    Stand-in for ``sgtk.util.register_publish``.
+    """
+    data = {
+        "code": os.path.basename(path),
+        "description": kwargs.get("comment"),
+        "entity": context.entity,
+        "name": name,
+        "project": context.project,
+        "task": context.task,
+        "path": {"local_path": path},
+        "version_number": version_number,
+    }
+    data.update(kwargs.get("sg_fields") or {})
+    if dry_run:
+        return data
+    if kwargs.get("dependency_paths"):
+        # register_publish looks the dependency paths up itself
+        find_publish(tk, kwargs["dependency_paths"])
+    if kwargs.get("thumbnail_path"):
+        tk.shotgun.upload_thumbnail("PublishedFile", None, kwargs["thumbnail_path"])
+    return tk.shotgun.create("PublishedFile", data)
+
+
+def find_publish(tk, list_of_paths, filters=None, fields=None, **kwargs):
+    """
+    Stand-in for ``sgtk.util.find_publish``.
+    """
+    publishes = tk.shotgun.find(
+        "PublishedFile", [["path", "in", list_of_paths]] + (filters or []), fields
+    )
+    return dict((publish["path"]["local_path"], publish) for publish in publishes)
+
+
+def resolve_publish_path(tk, sg_publish_data):
+    """
+    Stand-in for ``sgtk.util.resolve_publish_path``.
+    """
+    return sg_publish_data["path"]["local_path"]
+
+
+class ShotgunPath(object):
+    """
+    Stand-in for ``sgtk.util.ShotgunPath``.
+    """
+
+    @staticmethod
+    def normalize(path):
+        return os.path.normpath(path)
+
+
+def copy_file(src, dst, permissions=0o666):
+    shutil.copy(src, dst)
+    os.chmod(dst, permissions)
+
+
+def ensure_folder_exists(path, permissions=0o775, create_placeholder_file=False):
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path, permissions)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+
+class StubHook(object):
+    """
+    Stand-in for ``sgtk.Hook``.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.logger = logging.getLogger("publish_benchmark.hook")
+        self.disk_location = HOOKS_FOLDER
+
+
+class StubBasePlugin(StubHook):
+    """
+    Stand-in for the publisher's base publish plugin.
+    """
+
+    @property
+    def settings(self):
+        return {}
+
+
+class StubBaseCollector(StubHook):
+    """
+    Stand-in for the publisher's basic collector hook.
+    """
+
+    @property
+    def settings(self):
+        return {}
+
+    def _get_item_info(self, path):
+        return {
+            "item_type": "file.image",
+            "type_display": "Rendered Image",
+            "icon_path": None,
+        }
+
+    def _collect_file(self, parent_item, path, frame_sequence=False):
+        item = parent_item.create_item(
+            "file.image.sequence" if frame_sequence else "file.image",
+            "Rendered Image Sequence" if frame_sequence else "Rendered Image",
+            os.path.basename(path),
+        )
+        item.properties["path"] = path
+        return item
+
+
+################################################################################
+# nuke stand-ins
+
+
+class StubKnob(object):
+    def __init__(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+    def evaluate(self):
+        return self._value
+
+    def setValue(self, value):
+        self._value = value
+
+
+class StubNode(object):
+    def __init__(self, node_class, name, knobs):
+        self._class = node_class
+        self._name = name
+        self._knobs = dict((key, StubKnob(value)) for (key, value) in knobs.items())
+
+    def Class(self):
+        return self._class
+
+    def name(self):
+        return self._name
+
+    def fullName(self):
+        return self._name
+
+    def knob(self, name):
+        return self._knobs.get(name)
+
+    def __getitem__(self, name):
+        return self._knobs[name]
+
+
+def make_nuke_module(nodes, first_frame, last_frame):
+    nuke = types.ModuleType("nuke")
+    root = StubNode(
+        "Root",
+        "Root",
+        {"first_frame": first_frame, "last_frame": last_frame, "proxy": False},
+    )
+    nuke.root = lambda: root
+    nuke.selectedNodes = lambda *args: list(nodes)
+    nuke.allNodes = lambda *args, **kwargs: [
+        node for node in nodes if not args or node.Class() == args[0]
+    ]
+    nuke.NUKE_VERSION_MAJOR = 13
+    nuke.GUI = True
+    return nuke
+
+
+################################################################################
+# harness
+
+
+def install_stub_modules(nuke_module, engine):
+    """
+    Register the stand-in modules so the hooks can be imported.
+    """
+    sgtk = types.ModuleType("sgtk")
+    sgtk.Hook = StubHook
+    sgtk.get_hook_baseclass = lambda: StubHook
+
+    util = types.ModuleType("sgtk.util")
+    util.register_publish = register_publish
+    util.find_publish = find_publish
+    util.resolve_publish_path = resolve_publish_path
+    util.ShotgunPath = ShotgunPath
+    util.get_published_file_entity_type = lambda tk: "PublishedFile"
+    util.is_windows = lambda: sys.platform == "win32"
+    util.is_macos = lambda: sys.platform == "darwin"
+    util.is_linux = lambda: sys.platform.startswith("linux")
+
+    filesystem = types.ModuleType("sgtk.util.filesystem")
+    filesystem.copy_file = copy_file
+    filesystem.ensure_folder_exists = ensure_folder_exists
+
+    platform = types.ModuleType("sgtk.platform")
+    platform.current_engine = lambda: engine
+
+    sgtk.util = util
+    util.filesystem = filesystem
+    sgtk.platform = platform
+
+    sys.modules.update(
+        {
+            "sgtk": sgtk,
+            "sgtk.util": util,
+            "sgtk.util.filesystem": filesystem,
+            "sgtk.platform": platform,
+            "nuke": nuke_module,
+        }
+    )
+    return sgtk
+
+
+def load_hook(sgtk, file_name, base_class):
+    """
+    Import a hook file with the supplied base class.
+    """
+    sgtk.get_hook_baseclass = lambda: base_class
+    module_name = "benchmark_%s" % (os.path.splitext(file_name)[0],)
+    spec = importlib.util.spec_from_file_location(
+        module_name, os.path.join(HOOKS_FOLDER, file_name)
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_settings(plugin, overrides):
+    settings = dict(
+        (name, StubSetting(setting["default"]))
+        for (name, setting) in plugin.settings.items()
+    )
+    for name, value in overrides.items():
+        settings[name] = StubSetting(value)
+    return settings
+
+
+def generate_sequences(root, items, frames, frame_size, template):
+    """
+    Write the synthetic EXR sequences to disk.
+
+    :return: A list of (output name, sequence path) tuples.
+    """
+    payload = EXR_MAGIC + os.urandom(max(0, frame_size - len(EXR_MAGIC)))
+    sequences = []
+    for index in range(items):
+        output = "out%02d" % (index,)
+        fields = {"Shot": "sh010", "nuke.output": output, "version": 1}
+        for frame in range(1, frames + 1):
+            fields["SEQ"] = frame
+            frame_path = template.apply_fields(fields)
+            ensure_folder_exists(os.path.dirname(frame_path))
+            with open(frame_path, "wb") as frame_file:
+                frame_file.write(payload)
+        fields["SEQ"] = "FORMAT: %d"
+        sequences.append((output, template.apply_fields(fields)))
+    return sequences
+
+
+class PhaseTimer(object):
+    """
+    Records the wall time and Shotgun calls of each phase.
+    """
+
+    def __init__(self, shotgun):
+        self._shotgun = shotgun
+        self.phases = collections.OrderedDict()
+
+    def run(self, name, func):
+        calls_before = collections.Counter(self._shotgun.calls)
+        start = time.time()
+        result = func()
+        duration = time.time() - start
+        calls = collections.Counter(self._shotgun.calls)
+        calls.subtract(calls_before)
+        self.phases[name] = {
+            "seconds": duration,
+            "sg_calls": dict((key, value) for (key, value) in calls.items() if value),
+        }
+        return result
+
+
+def run_benchmark(args):
+    root = tempfile.mkdtemp(prefix="publish_benchmark_")
+    try:
+        return _run_benchmark(args, root)
+    finally:
+        if args.keep:
+            logger.info("Kept benchmark files in: %s" % (root,))
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def _run_benchmark(args, root):
+    work_template = StubTemplate("nuke_render_work", root, WORK_DEFINITION)
+    publish_template = StubTemplate("nuke_render_publish", root, PUBLISH_DEFINITION)
+
+    if args.in_place:
+        # the write nodes render straight to the publish location
+        render_template = publish_template
+    else:
+        # the write nodes render to a work area and are copied on publish
+        render_template = StubTemplate("nuke_render_publish", root, WORK_DEFINITION)
+
+    logger.info(
+        "Generating %s sequences of %s frames of %s bytes..."
+        % (args.items, args.frames, args.frame_size)
+    )
+    sequences = generate_sequences(
+        root, args.items, args.frames, args.frame_size, render_template
+    )
+
+    nodes = [
+        StubNode("Write", "Write_%s" % (output,), {"file": path})
+        for (output, path) in sequences
+    ]
+    engine = StubEngine({"nuke_render_publish": render_template})
+    nuke_module = make_nuke_module(nodes, 1, args.frames)
+    sgtk = install_stub_modules(nuke_module, engine)
+
+    collector_module = load_hook(sgtk, "collector.py", StubBaseCollector)
+    # the plugin is configured on top of the measured plugin base class
+    measured_plugin_module = load_hook(sgtk, "measured_plugin.py", StubBasePlugin)
+    publish_file_module = load_hook(
+        sgtk, "publish_file.py", measured_plugin_module.MeasuredPublishPlugin
+    )
+
+    publisher = StubPublisher(engine, root)
+    collector = collector_module.NukeSessionCollector(publisher)
+    plugin = publish_file_module.BasicFilePublishPlugin(publisher)
+    settings = get_settings(plugin, args.settings)
+    collector_settings = get_settings(collector, {})
+
+    # published plates and layers each item depends on
+    dependency_paths = []
+    for index in range(args.dependencies):
+        dependency_path = os.path.join(root, "plates", "plate%03d.%%04d.exr" % (index,))
+        publisher.shotgun.create(
+            "PublishedFile", {"path": {"local_path": dependency_path}}
+        )
+        dependency_paths.append(dependency_path)
+
+    root_item = StubItem("root", "__root__", "Root", None, publisher.context)
+    timer = PhaseTimer(publisher.shotgun)
+
+    timer.run(
+        "collect",
+        lambda: collector.process_current_session(collector_settings, root_item),
+    )
+    items = list(root_item.descendants)
+
+    # reopening the publisher collects the unchanged session again, with a
+    # new collector
+    def recollect():
+        collector_module.NukeSessionCollector(publisher).process_current_session(
+            collector_settings,
+            StubItem("root", "__root__", "Root", None, publisher.context),
+        )
+
+    timer.run("recollect", recollect)
+
+    for item in items:
+        item.current_plugin = plugin
+        if dependency_paths:
+            item.properties["publish_dependencies"] = dependency_paths
+        if not args.in_place:
+            item.properties["work_template"] = work_template
+            item.properties["publish_template"] = publish_template
+
+    def run_phase(method):
+        def run():
+            for item in items:
+                method(settings, item)
+
+        return run
+
+    timer.run("accept", run_phase(plugin.accept))
+    timer.run("validate", run_phase(plugin.validate))
+    timer.run("publish", run_phase(plugin.publish))
+    timer.run("finalize", run_phase(plugin.finalize))
+
+    copied_bytes = 0 if args.in_place else args.items * args.frames * args.frame_size
+    publish_seconds = timer.phases["publish"]["seconds"]
+    results = {
+        "items": args.items,
+        "frames": args.frames,
+        "frame_size": args.frame_size,
+        "settings": args.settings,
+        "phases": timer.phases,
+        "total_seconds": sum(phase["seconds"] for phase in timer.phases.values()),
+        "sg_calls": dict(publisher.shotgun.calls),
+        "copied_bytes": copied_bytes,
+        "copy_mb_per_second": (
+            copied_bytes / (1024.0 * 1024.0) / publish_seconds
+            if copied_bytes and publish_seconds
+            else None
+        ),
+    }
+    return results
+
+
+def print_results(results):
+    print(
+        "%s items x %s frames x %s bytes"
+        % (results["items"], results["frames"], results["frame_size"])
+    )
+    print("%-10s %10s  %s" % ("phase", "seconds", "shotgun calls"))
+    for name, phase in results["phases"].items():
+        calls = ", ".join(
+            "%s=%s" % (key, value) for (key, value) in sorted(phase["sg_calls"].items())
+        )
+        print("%-10s %10.3f  %s" % (name, phase["seconds"], calls or "-"))
+    print("%-10s %10.3f" % ("total", results["total_seconds"]))
+    if results["copy_mb_per_second"]:
+        print("copy throughput: %.1f MB/s" % (results["copy_mb_per_second"],))
+
+
+def parse_setting(value):
+    name, _, raw_value = value.partition("=")
+    try:
+        parsed_value = json.loads(raw_value)
+    except ValueError:
+        parsed_value = raw_value
+    return (name.strip(), parsed_value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=4, help="Number of Write nodes")
+    parser.add_argument("--frames", type=int, default=200, help="Frames per node")
+    parser.add_argument(
+        "--frame-size", type=float, default=1.0, help="Size of each frame in MB"
+    )
+    parser.add_argument(
+        "--dependencies",
+        type=int,
+        default=0,
+        help="Number of published files each node depends on",
+    )
+    parser.add_argument(
+        "--in-place",
+        action="store_true",
+        help="Render straight to the publish location instead of copying",
+    )
+    parser.add_argument(
+        "--setting",
+        action="append",
+        default=[],
+        type=parse_setting,
+        dest="settings",
+        help="Override a publish plugin setting, as Name=value",
+    )
+    parser.add_argument("--json", help="Write the results to this json file")
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the generated files on disk"
+    )
+    parser.add_argument("--verbose", action="store_true", help="Show the hook logs")
+    args = parser.parse_args(argv)
+    args.frame_size = int(args.frame_size * 1024 * 1024)
+    args.settings = dict(args.settings)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(name)s: %(message)s",
+    )
+    if not args.verbose:
+        logging.getLogger("publish_benchmark.hook").setLevel(logging.WARNING)
+
+    # the publish hook looks up the user from the environment
+    os.environ.setdefault("USERNAME", "benchmark")
+
+    results = run_benchmark(args)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,12 +9,46 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
+import collections
+import copy
 import os
+import re
 import nuke
 import sgtk
 
+try:
+    import numpy
+except ImportError:
+    # optional, the frames are checked in python without it
+    numpy = None
+
 HookBaseClass = sgtk.get_hook_baseclass()
 
+# Maximum number of paths whose template fields are kept between collections
+_TEMPLATE_FIELDS_CACHE_SIZE = 1000
+
+# The template fields of the most recently collected paths, by template and
+# path, least recently used first
+_TEMPLATE_FIELDS = collections.OrderedDict()
+
+# Matches the printf style frame specifier of a sequence path, ie. %04d
+_FRAME_SPEC_REGEX = re.compile(r"%(0\d+)?d")
+
+# A frame smaller than this ratio of the size of its largest neighbour is
+# considered truncated
+_SHORT_FRAME_RATIO = 0.5
+
+# The properties collected for each output node by the last collection of the
+# session, by full node name, along with the key they were collected for. Kept
+# here since the publisher creates a new collector each time it is opened.
+_COLLECTED_OUTPUTS = {}
+
+# The frame numbers and file names found for each sequence path, and the file
+# names listed in each folder, along with the modification time of the folder
+# they were found for. Only those of the last collection are kept.
+_SEQUENCES = {}
+_FOLDER_FILES = {}
+
 # A look up of node types to parameters for finding outputs to publish
 _NUKE_OUTPUTS = {
     "Read": "file",
@@ -63,6 +97,15 @@ class NukeSessionCollector(HookBaseClass):
                 "to publish plugins via the collected item's "
                 "properties. ",
             },
+            "Collect All Outputs": {
+                "type": "bool",
+                "default": False,
+                "description": "Collect every Read, Write and WriteGeo node "
+                "of the script, including the nodes inside "
+                "groups, instead of only the selected nodes. "
+                "Always on when Nuke runs without a GUI, ie. "
+                "in batch publishes.",
+            },
         }
 
         # update the base settings with these settings
@@ -99,90 +142,413 @@ class NukeSessionCollector(HookBaseClass):
 
 
     def collect_outputs(self, settings, parent_item):
-        # iterate over all the known output types
-        for node_type in _NUKE_OUTPUTS:
+        # the frame range and the render template are the same for every node
+        first_frame = int(nuke.root()["first_frame"].value())
+        last_frame = int(nuke.root()["last_frame"].value())
+        current_engine = sgtk.platform.current_engine()
+        render_template = current_engine.get_template_by_name("nuke_render_publish")
+
+        # bucket the output nodes by type in a single pass over the nodes
+        # there is no selection to collect when running headless
+        if settings["Collect All Outputs"].value or not nuke.GUI:
+            nodes = nuke.allNodes(recurseGroups=True)
+        else:
+            nodes = nuke.selectedNodes()
 
-            # get all the instances of the node type
-            all_nodes_of_type = [n for n in nuke.selectedNodes() if n.Class() == node_type]
+        # the properties collected for each node in the previous collection
+        previous_outputs = dict(_COLLECTED_OUTPUTS)
+        _COLLECTED_OUTPUTS.clear()
 
-            # iterate over each instance
+        # the output paths collected, to drop the sequences of the others
+        file_paths = set()
 
+        nodes_by_type = {}
+        for node in nodes:
+            node_type = node.Class()
+            if node_type in _NUKE_OUTPUTS:
+                nodes_by_type.setdefault(node_type, []).append(node)
 
-            publisher = self.parent
-            engine = publisher.engine
+        # iterate over all the known output types
+        for node_type in _NUKE_OUTPUTS:
 
-            first_frame = int(nuke.root()["first_frame"].value())
-            last_frame = int(nuke.root()["last_frame"].value())
-            for node in all_nodes_of_type:
+            # iterate over each instance
+            for node in nodes_by_type.get(node_type, []):
                 param_name = _NUKE_OUTPUTS[node_type]
 
                 # evaluate the output path parameter which may include frame
                 # expressions/format
                 file_path = node[param_name].evaluate()
 
-
+                # only the outputs rendered with the render template can be
+                # published, ie. the plates read by the script are skipped
+                if not file_path or not render_template.validate(file_path):
+                    self.logger.debug(
+                        "Skipping %s node %s, its output doesn't match the "
+                        "render template: %s" % (node_type, node.name(), file_path)
+                    )
+                    continue
 
                 self.logger.info("Processing %s node: %s" % (node_type, node.name()))
+                file_paths.add(file_path)
 
-                # file exists, let the basic collector handle it
-                item = super(NukeSessionCollector, self)._collect_file(
-                    parent_item, file_path, frame_sequence=True
-                )
-
+                # the frames of the sequence found on disk, if it is one
+                sequence = self._get_sequence(file_path)
 
+                # reuse the item collected for the node if neither its output,
+                # the files rendered nor the frame range changed since the
+                # last collection. frames rendered again in place don't change
+                # the modification time of their folder.
+                if sequence is None:
+                    files_key = _get_mtime(file_path)
+                else:
+                    files_key = tuple(
+                        zip(sequence["frames"], sequence["sizes"], sequence["mtimes"])
+                    )
+                cache_key = (
+                    repr(render_template),
+                    file_path,
+                    files_key,
+                    first_frame,
+                    last_frame,
+                )
+                cached = previous_outputs.get(node.fullName())
+                if cached is not None and cached[0] == cache_key:
+                    (item_info, properties) = cached[1]
+                    item = self._create_output_item(parent_item, file_path, item_info)
+                else:
+                    # file exists, let the basic collector handle it
+                    item = super(NukeSessionCollector, self)._collect_file(
+                        parent_item, file_path, frame_sequence=True
+                    )
+                    item_info = {
+                        "type_spec": item.type_spec,
+                        "type_display": item.type_display,
+                        "name": item.name,
+                    }
+                    properties = self._collect_output_properties(
+                        item,
+                        file_path,
+                        sequence,
+                        render_template,
+                        first_frame,
+                        last_frame,
+                    )
+                _COLLECTED_OUTPUTS[node.fullName()] = (
+                    cache_key,
+                    (item_info, properties),
+                )
 
+                for (name, value) in properties.items():
+                    if isinstance(value, (dict, list)):
+                        value = copy.deepcopy(value)
+                    item.properties[name] = value
+                item.thumbnail_enabled = True
 
-                #SUBMIT FOR REVIEW
+                # the item has been created. update the display name to include
+                # the nuke node to make it clear to the user how it was
+                # collected within the current session.
+                item.name = "%s (%s)" % (item.name, node.name())
 
-                rendered_files = file_path
+        folders = set(os.path.dirname(file_path) for file_path in file_paths)
+        for path in list(_SEQUENCES):
+            if path not in file_paths:
+                del _SEQUENCES[path]
+        for folder in list(_FOLDER_FILES):
+            if folder not in folders:
+                del _FOLDER_FILES[folder]
 
 
-                # some files rendered, use first frame to get some publish item info
-                path = rendered_files[0]
+    def _create_output_item(self, parent_item, file_path, item_info):
+        """
+        Create the item of an output collected before, the way the basic
+        collector does, without going through the files of the output again.
 
+        :param parent_item: The parent item of the new item
+        :param str file_path: The evaluated output path of the node
+        :param dict item_info: The type and name of the item collected before
+        :returns: The new item
+        """
+        item = parent_item.create_item(
+            item_info["type_spec"], item_info["type_display"], item_info["name"]
+        )
+
+        file_info = self._get_item_info(file_path)
+        item.set_icon_from_path(file_info["icon_path"])
+        if file_info["item_type"].startswith("file.image"):
+            item.set_thumbnail_from_path(file_path)
+        return item
+
+    def _collect_output_properties(
+        self, item, file_path, sequence, render_template, first_frame, last_frame
+    ):
+        """
+        Return the item properties of the supplied output.
+
+        :param item: The item collected by the basic collector for the output
+        :param str file_path: The evaluated output path of the node
+        :param dict sequence: The sequence found on disk, as returned by
+            :meth:`_get_sequence`, or None if the output isn't a sequence
+        :param render_template: The render template
+        :param int first_frame: The first frame of the script
+        :param int last_frame: The last frame of the script
+        :returns: A dictionary of item properties
+        """
+        properties = {}
 
-                publish_path = file_path
+        # SUBMIT FOR REVIEW
 
-                # construct publish name:
-                current_engine = sgtk.platform.current_engine()
-                render_template = current_engine.get_template_by_name('nuke_render_publish')
-                render_path_fields = render_template.get_fields(publish_path)
+        publish_path = file_path
 
-                rp_name = render_path_fields.get("name")
-                rp_channel = render_path_fields.get("channel")
-                if not rp_name and not rp_channel:
-                    publish_name = "Publish"
-                elif not rp_name:
-                    publish_name = "Channel %s" % rp_channel
-                elif not rp_channel:
-                    publish_name = rp_name
-                else:
-                    publish_name = "%s, Channel %s" % (rp_name, rp_channel)
-                shot_name = render_path_fields.get("Shot")
-                task_name = render_path_fields.get("nuke.output")
-                version_number = render_path_fields.get("version")
+        # construct publish name:
+        render_path_fields = self._get_template_fields(render_template, publish_path)
 
-                sg_publish_data = ('%s_%s_%s.mov') % (shot_name, task_name, version_number)
-                item.properties['sg_publish_data'] = sg_publish_data
+        rp_name = render_path_fields.get("name")
+        rp_channel = render_path_fields.get("channel")
+        if not rp_name and not rp_channel:
+            publish_name = "Publish"
+        elif not rp_name:
+            publish_name = "Channel %s" % rp_channel
+        elif not rp_channel:
+            publish_name = rp_name
+        else:
+            publish_name = "%s, Channel %s" % (rp_name, rp_channel)
+        shot_name = render_path_fields.get("Shot")
+        task_name = render_path_fields.get("nuke.output")
+        version_number = render_path_fields.get("version")
+
+        sg_publish_data = ("%s_%s_%s.mov") % (shot_name, task_name, version_number)
+        properties["sg_publish_data"] = sg_publish_data
+
+        properties["color_space"] = "Output - Rec709"
+
+        properties["first_frame"] = first_frame
+        properties["last_frame"] = last_frame
+        properties["path"] = publish_path
+        properties["publish_name"] = ("%s_%s") % (shot_name, task_name)
+        properties["publish_template"] = render_template
+        properties["work_template"] = render_template
+        # the fields of the path, so the plugins don't parse it again
+        properties["work_fields"] = dict(render_path_fields)
+        if sequence is not None:
+            properties["sequence_paths"] = sequence["paths"]
+            properties["sequence_frames"] = dict(
+                (key, sequence[key])
+                for key in ("frames", "first", "last", "missing", "count")
+            )
+            properties["frame_check"] = self._check_frames(
+                sequence, first_frame, last_frame
+            )
+        elif item.get_property("sequence_paths"):
+            # a sequence found by the basic collector, ie. a frame number
+            properties["sequence_paths"] = list(item.get_property("sequence_paths"))
+        properties["publish_version"] = version_number
+        return properties
+
+    def _get_template_fields(self, template, path):
+        """
+        Return the fields of the supplied path extracted with the template.
 
+        The fields of the most recently collected paths are kept so that
+        collecting the session again doesn't parse the same paths again.
 
-                item.properties["color_space"] = 'Output - Rec709'
+        :param template: The template to extract the fields with
+        :param str path: The path to extract the fields from
+        :returns: A dictionary of fields
+        """
+        # the representation includes the name and definition of the template
+        key = (repr(template), path)
+        fields = _TEMPLATE_FIELDS.pop(key, None)
+        if fields is None:
+            fields = template.get_fields(path)
+            if len(_TEMPLATE_FIELDS) >= _TEMPLATE_FIELDS_CACHE_SIZE:
+                # drop the least recently used
+                _TEMPLATE_FIELDS.popitem(last=False)
+        _TEMPLATE_FIELDS[key] = fields
+        return dict(fields)
+
+    def _get_sequence(self, path):
+        """
+        Find the frames of the sequence with the supplied path on disk.
+
+        The folder of the sequence is listed once and the file names matched
+        against a single regular expression. The frames found are kept until
+        the modification time of the folder changes, so collecting the session
+        again doesn't list unchanged folders again. The frames are stat'ed
+        each time, since rendering them again in place doesn't change the
+        modification time of their folder.
+
+        :param str path: A path with a frame specifier, ie. ``%04d`` or ``####``
+        :returns: None if the path isn't a sequence path, otherwise a
+            dictionary of the form::
+
+                {
+                    "paths": ["/path/to/file.1001.exr", ...],  # sorted by frame
+                    "frames": [1001, ...],
+                    "sizes": [4194304, ...],  # in bytes
+                    "mtimes": [1600000000.0, ...],
+                    "first": 1001,  # None if no frames were found
+                    "last": 1100,  # None if no frames were found
+                    "missing": [1050, 1051],  # gaps between first and last
+                    "count": 98,
+                }
+        """
+        frame_regex = _get_frame_regex(os.path.basename(path))
+        if frame_regex is None:
+            return None
 
-                item.properties["first_frame"] = first_frame
-                item.properties["last_frame"] = last_frame
-                item.properties["path"] = publish_path
-                item.properties["publish_name"] = ('%s_%s') % (shot_name, task_name)
-                item.properties["publish_template"] = render_template
-                item.properties["work_template"] = render_template
-                item.properties["sequence_paths"] = rendered_files
-                item.properties["publish_version"] = version_number
-                item.thumbnail_enabled = True
+        folder = os.path.dirname(path)
+        mtime = _get_mtime(folder)
 
-                # the item has been created. update the display name to include
-                # the nuke node to make it clear to the user how it was
-                # collected within the current session.
-                item.name = "%s (%s)" % (item.name, node.name())
+        cached = _SEQUENCES.get(path)
+        if cached is not None and cached[0] == mtime:
+            frame_files = cached[1]
+        else:
+            frames = {}
+            if mtime is not None:
+                for file_name in self._get_file_names(folder, mtime):
+                    match = frame_regex.match(file_name)
+                    if match:
+                        frames[int(match.group(1))] = file_name
+            frame_files = sorted(frames.items())
+            _SEQUENCES[path] = (mtime, frame_files)
+
+        sequence = {
+            "paths": [],
+            "frames": [],
+            "sizes": [],
+            "mtimes": [],
+            "first": None,
+            "last": None,
+            "missing": [],
+            "count": 0,
+        }
+        for (frame, file_name) in frame_files:
+            frame_path = os.path.join(folder, file_name)
+            try:
+                stat = os.stat(frame_path)
+            except OSError:
+                # removed since the folder was listed
+                continue
+            sequence["paths"].append(frame_path)
+            sequence["frames"].append(frame)
+            sequence["sizes"].append(stat.st_size)
+            sequence["mtimes"].append(stat.st_mtime)
+
+        frame_numbers = sequence["frames"]
+        if frame_numbers:
+            present = set(frame_numbers)
+            sequence["first"] = frame_numbers[0]
+            sequence["last"] = frame_numbers[-1]
+            sequence["missing"] = [
+                frame
+                for frame in range(frame_numbers[0], frame_numbers[-1] + 1)
+                if frame not in present
+            ]
+            sequence["count"] = len(frame_numbers)
+        return sequence
+
+    def _get_file_names(self, folder, mtime):
+        """
+        Return the names of the files in the supplied folder, listing it once
+        per modification time of the folder.
 
+        :param str folder: The folder to list
+        :param float mtime: The current modification time of the folder
+        :returns: A list of file names
+        """
+        cached = _FOLDER_FILES.get(folder)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        scandir = getattr(os, "scandir", None)
+        file_names = []
+        try:
+            if scandir is None:
+                # python 2
+                file_names = [
+                    name
+                    for name in os.listdir(folder)
+                    if os.path.isfile(os.path.join(folder, name))
+                ]
+            else:
+                file_names = [
+                    entry.name for entry in scandir(folder) if entry.is_file()
+                ]
+        except OSError:
+            pass
+
+        _FOLDER_FILES[folder] = (mtime, file_names)
+        return file_names
+
+    def _check_frames(self, sequence, first_frame, last_frame):
+        """
+        Check the frames of the sequence within the supplied frame range for
+        missing and truncated files.
+
+        A frame is truncated if its file is empty or much smaller than the
+        largest of the frames next to it. The checks are done on arrays with
+        numpy if it is available.
+
+        :param dict sequence: The sequence, as returned by :meth:`_get_sequence`
+        :param int first_frame: The first frame of the range to check
+        :param int last_frame: The last frame of the range to check
+        :returns: A dictionary of the form::
+
+                {
+                    "first_frame": 1001,
+                    "last_frame": 1100,
+                    "missing": [1050, 1051],
+                    "short": [1075],
+                }
+        """
+        frame_check = {
+            "first_frame": first_frame,
+            "last_frame": last_frame,
+            "missing": [],
+            "short": [],
+        }
+        if last_frame < first_frame:
+            return frame_check
+
+        if numpy is not None:
+            frames = numpy.array(sequence["frames"], dtype=numpy.int64)
+            sizes = numpy.array(sequence["sizes"], dtype=numpy.int64)
+            in_range = (frames >= first_frame) & (frames <= last_frame)
+            (frames, sizes) = (frames[in_range], sizes[in_range])
+
+            present = numpy.zeros(last_frame - first_frame + 1, dtype=bool)
+            present[frames - first_frame] = True
+            missing = numpy.flatnonzero(~present) + first_frame
+
+            # the largest of the previous and next frames found
+            padded_sizes = numpy.concatenate(([0], sizes, [0]))
+            neighbour_sizes = numpy.maximum(padded_sizes[:-2], padded_sizes[2:])
+            is_short = (sizes == 0) | (sizes < neighbour_sizes * _SHORT_FRAME_RATIO)
+            short = frames[is_short]
+
+            frame_check["missing"] = missing.tolist()
+            frame_check["short"] = short.tolist()
+            return frame_check
+
+        frame_sizes = [
+            (frame, size)
+            for (frame, size) in zip(sequence["frames"], sequence["sizes"])
+            if first_frame <= frame <= last_frame
+        ]
+        present = set(frame for (frame, size) in frame_sizes)
+        frame_check["missing"] = [
+            frame
+            for frame in range(first_frame, last_frame + 1)
+            if frame not in present
+        ]
+        for (index, (frame, size)) in enumerate(frame_sizes):
+            neighbour_size = max(
+                frame_sizes[index - 1][1] if index > 0 else 0,
+                frame_sizes[index + 1][1] if index + 1 < len(frame_sizes) else 0,
+            )
+            if size == 0 or size < neighbour_size * _SHORT_FRAME_RATIO:
+                frame_check["short"].append(frame)
+        return frame_check
 
     def _get_node_colorspace(self, node):
         """
@@ -202,6 +568,47 @@ class NukeSessionCollector(HookBaseClass):
         return cs
 
 
+def _get_frame_regex(file_name):
+    """
+    Return a compiled regular expression matching the names of the frames of
+    the sequence with the supplied file name, capturing the frame number, or
+    None if the name doesn't have a single frame specifier.
+
+    :param str file_name: A file name with a frame specifier, ie. ``%04d`` or
+        ``####``
+    """
+    # nuke also accepts hashes as the frame specifier
+    file_name = re.sub(
+        r"#+", lambda match: "%%0%dd" % (len(match.group(0)),), file_name
+    )
+    frame_specs = list(_FRAME_SPEC_REGEX.finditer(file_name))
+    if len(frame_specs) != 1:
+        return None
+
+    frame_spec = frame_specs[0]
+    padding = frame_spec.group(1)
+    return re.compile(
+        r"%s(%s)%s$"
+        % (
+            re.escape(file_name[: frame_spec.start()]),
+            r"-?\d{%d,}" % (int(padding),) if padding else r"-?\d+",
+            re.escape(file_name[frame_spec.end() :]),
+        ),
+        re.IGNORECASE if os.path.normcase("A") == "a" else 0,
+    )
+
+
+def _get_mtime(path):
+    """
+    Return the modification time of the supplied path, or None if it doesn't
+    exist, ie. when nothing was rendered yet.
+    """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
 def _session_path():
     """
     Return the path to the current session
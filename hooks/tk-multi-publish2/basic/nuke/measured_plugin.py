@@ -0,0 +1,107 @@
+# Copyright (c) 2017 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import functools
+
+import sgtk
+
+HookBaseClass = sgtk.get_hook_baseclass()
+
+# The metrics hook measuring the phases of the plugins, unless configured
+# otherwise
+METRICS_HOOK = "{config}/tk-multi-publish2/basic/nuke/publish_metrics.py"
+
+
+def measured(phase):
+    """
+    Decorator measuring a phase of the plugin with its metrics hook.
+
+    :param str phase: The name of the phase
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, settings, item):
+            metrics = self._get_metrics(settings)
+            with metrics.measure(settings, self, phase, item):
+                return method(self, settings, item)
+
+        return wrapper
+
+    return decorator
+
+
+class MeasuredPublishPlugin(HookBaseClass):
+    """
+    Base class of the publish plugins measured by the metrics hook.
+
+    Inserted in the hook chain of a plugin, ie.
+    ``{config}/.../measured_plugin.py:{config}/.../upload_version.py``. The
+    plugin adds the "Metrics Hook" and "Metrics Log" settings defined here to
+    its own, and decorates its phases with
+    ``@HookBaseClass.measured("publish")``.
+    """
+
+    # available to the plugins through their HookBaseClass
+    measured = staticmethod(measured)
+
+    @property
+    def settings(self):
+        """
+        Dictionary defining the settings of the base class, with the settings
+        of the metrics hook.
+        """
+
+        # grab any base class settings
+        plugin_settings = super(MeasuredPublishPlugin, self).settings or {}
+
+        plugin_settings.update(
+            {
+                "Metrics Hook": {
+                    "type": "str",
+                    "default": METRICS_HOOK,
+                    "description": (
+                        "Hook measuring the duration, bytes, frames and Shotgun "
+                        "calls of each phase and step of the plugin."
+                    ),
+                },
+                "Metrics Log": {
+                    "type": "str",
+                    "default": "",
+                    "description": (
+                        "Path of a json lines file the metrics hook appends "
+                        "the measurements to. Environment variables are "
+                        "expanded. Leave empty to only log the measurements "
+                        "at debug level."
+                    ),
+                },
+            }
+        )
+        return plugin_settings
+
+    def _get_metrics(self, settings=None):
+        """
+        Return the instance of the hook configured in the "Metrics Hook"
+        setting.
+
+        :param settings: This plugin instance's configured settings. If not
+            supplied, the hook last returned is reused.
+        """
+        metrics = getattr(self, "_metrics", None)
+        if settings is None and metrics:
+            return metrics[1]
+
+        metrics_hook_path = settings["Metrics Hook"].value
+        if not metrics or metrics[0] != metrics_hook_path:
+            metrics = self._metrics = (
+                metrics_hook_path,
+                self.parent.create_hook_instance(metrics_hook_path),
+            )
+        return metrics[1]
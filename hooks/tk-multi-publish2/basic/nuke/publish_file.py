@@ -8,15 +8,113 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
+import errno
+import functools
+import hashlib
+import json
+import logging
 import os
 import pprint
+import re
+import shutil
+import sys
+import threading
+import time
 import traceback
+import weakref
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:
+    # not available on windows
+    fcntl = None
+
+try:
+    import xxhash
+except ImportError:
+    # optional, only needed for the xxh* checksum algorithms
+    xxhash = None
+
+try:
+    import ctypes
+    import ctypes.util
+
+    # flushes a whole filesystem in a single call. linux only.
+    _syncfs = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True).syncfs
+except (AttributeError, ImportError, OSError, TypeError):
+    _syncfs = None
 
 import sgtk
-from sgtk.util.filesystem import copy_file, ensure_folder_exists
+from sgtk.util.filesystem import ensure_folder_exists
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
+# The supported values for the "Transfer Mode" setting
+_TRANSFER_MODES = ["auto", "copy", "hardlink", "reflink", "copy_file_range"]
+
+# Linux ioctl request used to clone the extents of one file into another
+_FICLONE = 0x40049409
+
+# Like shutil, only copy between files with sendfile on Linux. Other platforms
+# only support sending to a socket.
+_USE_SENDFILE = hasattr(os, "sendfile") and sys.platform.startswith("linux")
+
+# Matches the frame specifier (ie. %04d) in a sequence path
+_FRAME_SPEC_REGEX = re.compile(r"%(0\d+)?d")
+
+# Name of the journal written to each publish folder to allow resuming copies
+_COPY_JOURNAL_NAME = ".publish_copy_journal.jsonl"
+
+# Name of the checksum manifest written to each publish folder. Formatted with
+# the checksum algorithm.
+_CHECKSUM_MANIFEST_NAME = ".publish_checksums.%s"
+
+# Size of the chunks read when hashing files
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+# Maximum number of items looked up per conflicting publishes query
+_CONFLICT_QUERY_CHUNK_SIZE = 50
+
+# Maximum number of requests sent in a single Shotgun batch call
+_SHOTGUN_BATCH_SIZE = 100
+
+# Adaptive copy concurrency is halved when the time taken to copy a byte
+# rises above this ratio of the fastest time observed, and increased again
+# once it falls back under the recovery ratio.
+_COPY_BACKOFF_LATENCY_RATIO = 3.0
+_COPY_RECOVERY_LATENCY_RATIO = 1.5
+
+# Weight of the latest copy in the moving average of the copy latency
+_COPY_LATENCY_SMOOTHING = 0.3
+
+# The bandwidth limiters shared by all the publishes of this session, by
+# bytes per second limit
+_BANDWIDTH_LIMITERS = {}
+_BANDWIDTH_LIMITERS_LOCK = threading.Lock()
+
+# The ids of the publishes of the dependency paths looked up this session, or
+# None if no publish was found, with the time they were looked up, by
+# normalized path. The paths published again are dropped.
+_DEPENDENCY_IDS = {}
+
+# Number of seconds the publishes of the dependency paths are kept
+_DEPENDENCY_CACHE_TIMEOUT = 60
+
+# The throughput of the last copy made this session, in bytes per second. Used
+# to estimate the duration of publish plans.
+_COPY_THROUGHPUT = None
+
+# The logger of the background copy running in the current thread, if any
+_BACKGROUND_COPY = threading.local()
+
+# Number of seconds conflicting publishes looked up for other items are kept
+_CONFLICT_CACHE_TIMEOUT = 60
+
+# The PublishedFile fields that identify publishes of the same file. These
+# match the fields used by the publisher's get_conflicting_publishes util.
+_CONFLICT_FIELDS = ["code", "entity", "name", "project", "task"]
+
 
 class BasicFilePublishPlugin(HookBaseClass):
     """
@@ -188,7 +286,8 @@ class BasicFilePublishPlugin(HookBaseClass):
         The type string should be one of the data types that toolkit accepts
         as part of its environment configuration.
         """
-        return {
+        # settings specific to this plugin
+        publish_settings = {
             "File Types": {
                 "type": "list",
                 "default": [
@@ -212,11 +311,212 @@ class BasicFilePublishPlugin(HookBaseClass):
                     "List of file types to include. Each entry in the list "
                     "is a list in which the first entry is the Shotgun "
                     "published file type and subsequent entries are file "
-                    "extensions that should be associated."
+                    "extensions that should be associated. Compound "
+                    "extensions such as bgeo.sc are supported."
+                ),
+            },
+            "Copy Workers": {
+                "type": "int",
+                "default": 8,
+                "description": (
+                    "Number of threads used to copy the files of a sequence "
+                    "to the publish location. A value of 1 copies the files "
+                    "one at a time."
+                ),
+            },
+            "Adaptive Copy Workers": {
+                "type": "bool",
+                "default": True,
+                "description": (
+                    "Reduce the number of files copied at once when the time "
+                    "taken to copy each file rises, as happens when the "
+                    "storage is saturated, and increase it again up to "
+                    "'Copy Workers' once it recovers."
+                ),
+            },
+            "Copy Bandwidth Limit": {
+                "type": "int",
+                "default": 0,
+                "description": (
+                    "Maximum number of MB/s copied by all the publishes of "
+                    "this session, to leave bandwidth for interactive work. "
+                    "Links and clones don't count towards the limit. 0 for "
+                    "no limit."
+                ),
+            },
+            "Priority File Size": {
+                "type": "int",
+                "default": 1024,
+                "description": (
+                    "Files smaller than this size, in KB, are copied before "
+                    "the larger files and aren't held back by the adaptive "
+                    "copy workers."
+                ),
+            },
+            "Transfer Mode": {
+                "type": "str",
+                "default": "auto",
+                "description": (
+                    "How work files are transferred to the publish location. "
+                    "One of: auto, copy, hardlink, reflink, copy_file_range. "
+                    "'auto' clones the files (reflink) or copies them in the "
+                    "kernel (copy_file_range) when the work and publish "
+                    "locations share a device, and copies them otherwise. "
+                    "'hardlink' shares the data with the work file, so it "
+                    "should only be used when work files are never rewritten "
+                    "in place. Any mode falls back to a regular copy when the "
+                    "operation is not supported."
+                ),
+            },
+            "Copy Block Size": {
+                "type": "int",
+                "default": 1024,
+                "description": (
+                    "Size, in KB, of the blocks read and written by a "
+                    "regular copy. Larger blocks mean fewer round trips to "
+                    "network storage."
+                ),
+            },
+            "Use Sendfile": {
+                "type": "bool",
+                "default": True,
+                "description": (
+                    "Let the kernel copy the data (sendfile) during a regular "
+                    "copy when no checksum is computed and the platform "
+                    "supports it, instead of reading it into Nuke."
+                ),
+            },
+            "Copy Read Ahead": {
+                "type": "bool",
+                "default": True,
+                "description": (
+                    "Advise the operating system that the work files are "
+                    "read sequentially so that it reads ahead of the copy, "
+                    "where supported."
+                ),
+            },
+            "Sync Copies": {
+                "type": "bool",
+                "default": False,
+                "description": (
+                    "Flush the published files to the storage before the "
+                    "publish is registered. The files are flushed with a "
+                    "single sync per filesystem where supported, or a sync "
+                    "per file and folder otherwise."
+                ),
+            },
+            "Resume Copies": {
+                "type": "bool",
+                "default": False,
+                "description": (
+                    "Record each copied file in a journal in the publish "
+                    "folder. When a publish is retried, files that are already "
+                    "present and identical to the journal entry are skipped. "
+                    "The journal is removed once all the files are copied."
+                ),
+            },
+            "Resume Verify Hash": {
+                "type": "bool",
+                "default": False,
+                "description": (
+                    "Also store a hash of each copied file in the journal and "
+                    "check it before skipping a file on retry."
+                ),
+            },
+            "Checksum Algorithm": {
+                "type": "str",
+                "default": "none",
+                "description": (
+                    "Hash algorithm used to checksum the files copied to the "
+                    "publish location, computed while the files are copied. "
+                    "Any hashlib algorithm (ie. blake2b, sha256), or xxh64, "
+                    "xxh3_64 or xxh3_128 if the xxhash module is available. "
+                    "'none' disables checksums."
+                ),
+            },
+            "Checksum Field": {
+                "type": "str",
+                "default": "sg_checksum",
+                "description": (
+                    "PublishedFile field the checksum of the published file or "
+                    "sequence is stored in. Leave empty to not store it in "
+                    "Shotgun."
+                ),
+            },
+            "Checksum Manifest": {
+                "type": "bool",
+                "default": False,
+                "description": (
+                    "Write a manifest with the checksum of every published "
+                    "file to the publish folder."
+                ),
+            },
+            "Pipelined Copy": {
+                "type": "bool",
+                "default": False,
+                "description": (
+                    "Copy the files to the publish location in the background "
+                    "while the publish is registered in Shotgun. The publish "
+                    "is created with the 'Copying Status' and switched to the "
+                    "'Published Status' once the copy has finished, during "
+                    "finalize. Plugins running after this one must not rely "
+                    "on the publish files being on disk."
+                ),
+            },
+            "Copying Status": {
+                "type": "str",
+                "default": "ip",
+                "description": (
+                    "Status code given to the publish while its files are "
+                    "being copied in 'Pipelined Copy' mode. Must be a valid "
+                    "PublishedFile status on the site."
+                ),
+            },
+            "Published Status": {
+                "type": "str",
+                "default": "cmpt",
+                "description": (
+                    "Status code given to the publish once its files have "
+                    "been copied in 'Pipelined Copy' mode. Must be a valid "
+                    "PublishedFile status on the site."
+                ),
+            },
+            "Require Complete Sequences": {
+                "type": "bool",
+                "default": False,
+                "description": (
+                    "Fail the validation of sequences with missing or "
+                    "truncated frames in the frame range of the script, as "
+                    "found by the collector or, for sequences published in "
+                    "place, on disk, instead of only warning about them."
+                ),
+            },
+            "Plan Only": {
+                "type": "bool",
+                "default": False,
+                "description": (
+                    "Only plan the publish. The files that would be copied, "
+                    "their size, the free space at the publish location and "
+                    "the estimated copy time are logged during validation, "
+                    "which then fails so that nothing is copied or written "
+                    "to Shotgun."
+                ),
+            },
+            "Estimated Throughput": {
+                "type": "int",
+                "default": 100,
+                "description": (
+                    "Copy throughput, in MB/s, used to estimate the duration "
+                    "of a planned publish until a copy has been measured."
                 ),
             },
         }
 
+        # update the base settings, which include the metrics settings
+        plugin_settings = super(BasicFilePublishPlugin, self).settings or {}
+        plugin_settings.update(publish_settings)
+        return plugin_settings
+
     @property
     def item_filters(self):
         """
@@ -231,6 +531,7 @@ class BasicFilePublishPlugin(HookBaseClass):
     ############################################################################
     # standard publish plugin methods
 
+    @HookBaseClass.measured("accept")
     def accept(self, settings, item):
         """
         Method called by the publisher to determine if an item is of any
@@ -259,6 +560,10 @@ class BasicFilePublishPlugin(HookBaseClass):
 
         path = item.properties.path
 
+        # remember the item so its conflicting publishes can be looked up
+        # along with the other items during validation
+        self._get_accepted_items().add(item)
+
         # log the accepted file and display a button to reveal it in the fs
         self.logger.info(
             "File publisher plugin accepted: %s" % (path,),
@@ -268,6 +573,7 @@ class BasicFilePublishPlugin(HookBaseClass):
         # return the accepted info
         return {"accepted": True}
 
+    @HookBaseClass.measured("validate")
     def validate(self, settings, item):
         """
         Validates the given item to check that it is ok to publish.
@@ -291,20 +597,39 @@ class BasicFilePublishPlugin(HookBaseClass):
         # base class plugin. They may have more information than is available
         # here such as custom type or template settings.
 
-        publish_path = self.get_publish_path(settings, item)
-        publish_name = self.get_publish_name(settings, item)
+        with self._get_metrics(settings).step("resolve"):
+            publish_path = self.get_publish_path(settings, item)
+            publish_name = self.get_publish_name(settings, item)
+
+        # ---- check the frames of the sequence
+
+        with self._get_metrics(settings).step("frames"):
+            frame_check = self._get_frame_check(settings, item)
+        if frame_check and (frame_check["missing"] or frame_check["short"]):
+            error_msg = (
+                "Incomplete sequence in the frame range %s-%s. Missing frames: "
+                "%s. Truncated frames: %s."
+                % (
+                    frame_check["first_frame"],
+                    frame_check["last_frame"],
+                    _format_frame_ranges(frame_check["missing"]) or "none",
+                    _format_frame_ranges(frame_check["short"]) or "none",
+                )
+            )
+            if settings["Require Complete Sequences"].value:
+                self.logger.error(error_msg)
+                raise Exception(error_msg)
+            self.logger.warning(error_msg)
 
         # ---- check for conflicting publishes of this path with a status
 
         # Note the name, context, and path *must* match the values supplied to
         # register_publish in the publish phase in order for this to return an
         # accurate list of previous publishes of this file.
-        publishes = publisher.util.get_conflicting_publishes(
-            item.context,
-            publish_path,
-            publish_name,
-            filters=["sg_status_list", "is_not", None],
-        )
+        with self._get_metrics(settings).step("conflicts"):
+            publishes = self._get_conflicting_publishes(
+                settings, item, publish_path, publish_name
+            )
 
         if publishes:
 
@@ -344,11 +669,41 @@ class BasicFilePublishPlugin(HookBaseClass):
                     },
                 )
 
+        if settings["Plan Only"].value:
+            with self._get_metrics(settings).step("plan"):
+                plan = self.get_publish_plan(settings, item)
+
+            plan_info = "<pre>%s</pre>" % (pprint.pformat(plan),)
+            self.logger.info(
+                "Publish plan: %s files, %.1f MB, about %.0f seconds"
+                % (plan["files"], plan["bytes"] / 1048576.0, plan["estimated_seconds"]),
+                extra={
+                    "action_show_more_info": {
+                        "label": "Show Plan",
+                        "tooltip": "Show the complete publish plan",
+                        "text": plan_info,
+                    }
+                },
+            )
+            if not plan["enough_space"]:
+                self.logger.warning(
+                    "Not enough free space at the publish location: %.1f MB "
+                    "available." % (plan["free_bytes"] / 1048576.0,)
+                )
+
+            error_msg = (
+                "The publish was planned but not run. Turn the 'Plan Only' "
+                "setting off to publish."
+            )
+            self.logger.error(error_msg)
+            raise Exception(error_msg)
+
         self.logger.info("A Publish will be created in Shotgun and linked to:")
         self.logger.info("  %s" % (path,))
 
         return True
 
+    @HookBaseClass.measured("publish")
     def publish(self, settings, item):
         """
         Executes the publish logic for the given item and settings.
@@ -360,6 +715,7 @@ class BasicFilePublishPlugin(HookBaseClass):
         """
 
         publisher = self.parent
+        metrics = self._get_metrics(settings)
 
         # ---- determine the information required to publish
 
@@ -367,15 +723,16 @@ class BasicFilePublishPlugin(HookBaseClass):
         # base class plugin. They may have more information than is available
         # here such as custom type or template settings.
 
-        publish_type = self.get_publish_type(settings, item)
-        publish_name = self.get_publish_name(settings, item)
-        publish_version = self.get_publish_version(settings, item)
-        publish_path = self.get_publish_path(settings, item)
-        publish_dependencies_paths = self.get_publish_dependencies(settings, item)
-        publish_user = self.get_publish_user(settings, item)
-        publish_fields = self.get_publish_fields(settings, item)
-        # catch-all for any extra kwargs that should be passed to register_publish.
-        publish_kwargs = self.get_publish_kwargs(settings, item)
+        with metrics.step("resolve"):
+            publish_type = self.get_publish_type(settings, item)
+            publish_name = self.get_publish_name(settings, item)
+            publish_version = self.get_publish_version(settings, item)
+            publish_path = self.get_publish_path(settings, item)
+            publish_dependencies_paths = self.get_publish_dependencies(settings, item)
+            publish_user = self.get_publish_user(settings, item)
+            # catch-all for any extra kwargs that should be passed to
+            # register_publish.
+            publish_kwargs = self.get_publish_kwargs(settings, item)
 
         # if the parent item has publish data, get it id to include it in the list of
         # dependencies
@@ -385,6 +742,20 @@ class BasicFilePublishPlugin(HookBaseClass):
                 item.parent.properties.sg_publish_data["id"]
             )
 
+        # look the dependency paths up together, through the paths already
+        # resolved this session, rather than leaving it to register_publish.
+        # paths without a publish are still passed on as paths.
+        with metrics.step("dependencies"):
+            (
+                dependency_ids,
+                publish_dependencies_paths,
+            ) = self._resolve_dependency_paths(publish_dependencies_paths)
+        publish_dependencies_ids.extend(
+            dependency_id
+            for dependency_id in dependency_ids
+            if dependency_id not in publish_dependencies_ids
+        )
+
 
 
         def get_userID():
@@ -398,7 +769,20 @@ class BasicFilePublishPlugin(HookBaseClass):
 
 
         # handle copying of work to publish if templates are in play
-        self._copy_work_to_publish(settings, item)
+        item.local_properties["publish_checksum"] = None
+        item.local_properties["publish_copy"] = None
+        if settings["Pipelined Copy"].value:
+            # copy in the background while the publish is registered. the
+            # copy is waited on in finalize.
+            self._start_copy_work_to_publish(settings, item)
+            publish_fields = dict(self.get_publish_fields(settings, item))
+            publish_fields["sg_status_list"] = settings["Copying Status"].value
+        else:
+            item.local_properties["publish_checksum"] = self._copy_work_to_publish(
+                settings, item
+            )
+            # the fields may include the checksum computed during the copy
+            publish_fields = self.get_publish_fields(settings, item)
 
         # arguments for publish registration
         self.logger.info("Registering publish...")
@@ -434,8 +818,18 @@ class BasicFilePublishPlugin(HookBaseClass):
 
         # create the publish and stash it in the item properties for other
         # plugins to use.
-        item.properties.sg_publish_data = sgtk.util.register_publish(**publish_data)
+        with metrics.step("register"):
+            item.properties.sg_publish_data = sgtk.util.register_publish(**publish_data)
+            # the publish is created, then its thumbnail uploaded
+            metrics.add(sg_calls=2 if publish_data["thumbnail_path"] else 1)
         self.logger.info("Publish registered!")
+
+        # the items depending on this path now depend on the new publish
+        _DEPENDENCY_IDS.pop(sgtk.util.ShotgunPath.normalize(publish_path), None)
+
+        # the conflicting publishes of all the items published by this plugin
+        # are cleared together during finalize, once their files are copied
+        self._get_published_items()[item] = item.properties.sg_publish_data
         self.logger.debug(
             "Shotgun Publish data...",
             extra={
@@ -448,6 +842,7 @@ class BasicFilePublishPlugin(HookBaseClass):
             },
         )
 
+    @HookBaseClass.measured("finalize")
     def finalize(self, settings, item):
         """
         Execute the finalization pass. This pass executes once
@@ -461,14 +856,19 @@ class BasicFilePublishPlugin(HookBaseClass):
         """
 
         publisher = self.parent
+        metrics = self._get_metrics(settings)
 
         # get the data for the publish that was just created in SG
         publish_data = item.properties.sg_publish_data
 
+        # wait for the files of a pipelined publish to be copied
+        if item.local_properties.get("publish_copy"):
+            with metrics.step("copy_wait"):
+                self._finish_copy_work_to_publish(settings, item)
+
         # ensure conflicting publishes have their status cleared
-        publisher.util.clear_status_for_conflicting_publishes(
-            item.context, publish_data
-        )
+        with metrics.step("clear_conflicts"):
+            self._clear_status_for_conflicting_publishes(item, publish_data)
 
         self.logger.info("Cleared the status of all previous, conflicting publishes")
 
@@ -513,38 +913,17 @@ class BasicFilePublishPlugin(HookBaseClass):
             return publish_type
 
         # fall back to the path info hook logic
-        publisher = self.parent
         path = item.properties.path
 
-        # get the publish path components
-        path_info = publisher.util.get_file_path_components(path)
-
-        # determine the publish type
-        extension = path_info["extension"]
-
-        # ensure lowercase and no dot
-        if extension:
-            extension = extension.lstrip(".").lower()
-
-            for type_def in settings["File Types"].value:
-
-                publish_type = type_def[0]
-                file_extensions = type_def[1:]
-
-                if extension in file_extensions:
-                    # found a matching type in settings. use it!
-                    return publish_type
-
-        # --- no pre-defined publish type found...
-
-        if extension:
-            # publish type is based on extension
-            publish_type = "%s File" % extension.capitalize()
-        else:
-            # no extension, assume it is a folder
-            publish_type = "Folder"
-
-        return publish_type
+        cache = self._get_resolution_cache(item)
+        cache_key = (
+            "publish_type",
+            path,
+            tuple(tuple(type_def) for type_def in settings["File Types"].value),
+        )
+        if cache_key not in cache:
+            cache[cache_key] = self._resolve_publish_type(settings, path)
+        return cache[cache_key]
 
     def get_publish_path(self, settings, item):
         """
@@ -571,14 +950,23 @@ class BasicFilePublishPlugin(HookBaseClass):
         work_template = item.properties.get("work_template")
         publish_template = self.get_publish_template(settings, item)
 
-        work_fields = []
+        cache = self._get_resolution_cache(item)
+        cache_key = (
+            "publish_path",
+            path,
+            _template_key(work_template),
+            _template_key(publish_template),
+        )
+        if cache_key in cache:
+            return cache[cache_key]
+
+        work_fields = {}
         publish_path = None
 
         # We need both work and publish template to be defined for template
         # support to be enabled.
         if work_template and publish_template:
-            if work_template.validate(path):
-                work_fields = work_template.get_fields(path)
+            work_fields = self._get_work_fields(item, work_template, path) or {}
 
             missing_keys = publish_template.missing_keys(work_fields)
 
@@ -603,6 +991,7 @@ class BasicFilePublishPlugin(HookBaseClass):
                 "Could not validate a publish template. Publishing in place."
             )
 
+        cache[cache_key] = publish_path
         return publish_path
 
     def get_publish_version(self, settings, item):
@@ -629,10 +1018,15 @@ class BasicFilePublishPlugin(HookBaseClass):
         work_fields = None
         publish_version = None
 
+        cache = self._get_resolution_cache(item)
+        cache_key = ("publish_version", path, _template_key(work_template))
+        if cache_key in cache:
+            return cache[cache_key]
+
         if work_template:
-            if work_template.validate(path):
+            work_fields = self._get_work_fields(item, work_template, path)
+            if work_fields:
                 self.logger.debug("Work file template configured and matches file.")
-                work_fields = work_template.get_fields(path)
 
         if work_fields:
             # if version number is one of the fields, use it to populate the
@@ -647,6 +1041,7 @@ class BasicFilePublishPlugin(HookBaseClass):
             if publish_version is None:
                 publish_version = 1
 
+        cache[cache_key] = publish_version
         return publish_version
 
     def get_publish_name(self, settings, item):
@@ -676,7 +1071,13 @@ class BasicFilePublishPlugin(HookBaseClass):
             name_path = path
             is_sequence = False
 
-        return publisher.util.get_publish_name(name_path, sequence=is_sequence)
+        cache = self._get_resolution_cache(item)
+        cache_key = ("publish_name", name_path, is_sequence)
+        if cache_key not in cache:
+            cache[cache_key] = publisher.util.get_publish_name(
+                name_path, sequence=is_sequence
+            )
+        return cache[cache_key]
 
     def get_publish_dependencies(self, settings, item):
         """
@@ -727,12 +1128,24 @@ class BasicFilePublishPlugin(HookBaseClass):
         If publish_fields is not defined as a ``property`` or
         ``local_property``, this method will return an empty dictionary.
 
+        If a checksum was computed while copying the files to the publish
+        location, it is added to the field configured by the "Checksum Field"
+        setting.
+
         :param settings: This plugin instance's configured settings
         :param item: The item to determine the publish template for
 
         :return: A dictionary of field names and values for those fields.
         """
-        return item.get_property("publish_fields", default_value={})
+        publish_fields = item.get_property("publish_fields", default_value={})
+
+        checksum = item.local_properties.get("publish_checksum")
+        checksum_field = settings["Checksum Field"].value
+        if checksum and checksum_field:
+            publish_fields = dict(publish_fields)
+            publish_fields[checksum_field] = checksum
+
+        return publish_fields
 
     def get_publish_kwargs(self, settings, item):
         """
@@ -753,6 +1166,103 @@ class BasicFilePublishPlugin(HookBaseClass):
         """
         return item.get_property("publish_kwargs", default_value={})
 
+    def get_publish_plan(self, settings, item):
+        """
+        Plan the publish of the supplied item without copying any file or
+        writing to Shotgun.
+
+        The templates are resolved the same way as during the publish. The
+        sizes of the files are gathered by listing each work and publish folder
+        once rather than by querying every file.
+
+        :param settings: This plugin instance's configured settings
+        :param item: The item to plan the publish of
+
+        :return: A dictionary of the form::
+
+            {
+                "publish_path": "/path/to/publish/file.%04d.exr",
+                # (work file, publish file) tuples. empty when the item is
+                # published in place.
+                "copies": [
+                    ("/work/file.1001.exr", "/publish/file.1001.exr"),
+                    ...
+                ],
+                "files": 100,
+                "bytes": 1073741824,
+                # work files not found on disk
+                "missing_sources": [],
+                # publish files that would be overwritten
+                "existing_destinations": [],
+                # smallest free space of the publish filesystems, None if unknown
+                "free_bytes": 1099511627776,
+                "enough_space": True,
+                # bytes per second the estimate is based on. the throughput
+                # of the last copy made this session if any, or the
+                # "Estimated Throughput" setting.
+                "throughput": 104857600.0,
+                "estimated_seconds": 10.24,
+            }
+        """
+
+        copy_pairs = []
+        if not self._is_published_in_place(settings, item):
+            copy_pairs = self._get_copy_pairs(settings, item) or []
+
+        folder_sizes = {}
+
+        def get_size(path):
+            folder, name = os.path.split(path)
+            if folder not in folder_sizes:
+                folder_sizes[folder] = _get_file_sizes(folder)
+            return folder_sizes[folder].get(name)
+
+        total_bytes = 0
+        missing_sources = []
+        existing_destinations = []
+        device_bytes = {}
+        device_free = {}
+        for (work_file, publish_file) in copy_pairs:
+            size = get_size(work_file)
+            if size is None:
+                missing_sources.append(work_file)
+                size = 0
+            total_bytes += size
+
+            if get_size(publish_file) is not None:
+                existing_destinations.append(publish_file)
+
+            publish_folder = os.path.dirname(publish_file)
+            if publish_folder not in device_free:
+                (device, free) = _get_disk_space(publish_folder)
+                device_free[publish_folder] = (device, free)
+            (device, free) = device_free[publish_folder]
+            device_bytes[device] = device_bytes.get(device, 0) + size
+
+        free_space = dict(device_free.values())
+        known_free = [free for free in free_space.values() if free is not None]
+        enough_space = all(
+            free_space[device] is None or needed <= free_space[device]
+            for (device, needed) in device_bytes.items()
+        )
+
+        throughput = _COPY_THROUGHPUT or (
+            settings["Estimated Throughput"].value * 1024.0 * 1024.0
+        )
+
+        return {
+            "publish_path": self.get_publish_path(settings, item),
+            "copies": copy_pairs,
+            "files": len(copy_pairs),
+            "bytes": total_bytes,
+            "missing_sources": missing_sources,
+            "existing_destinations": existing_destinations,
+            "free_bytes": min(known_free) if known_free else None,
+            "enough_space": enough_space,
+            "throughput": throughput,
+            "estimated_seconds": total_bytes / throughput if throughput else 0.0,
+        }
+
     ############################################################################
     # protected methods
 
@@ -777,24 +1287,183 @@ class BasicFilePublishPlugin(HookBaseClass):
         If the item has "sequence_paths" set, it will attempt to copy all paths
         assuming they meet the required criteria with respect to the templates.
 
+        :return: The "<algorithm>:<checksum>" of the published files, or None
+            if no checksum was computed.
+        """
+
+        global _COPY_THROUGHPUT
+
+        logger = self._get_copy_logger()
+
+        if self._is_published_in_place(settings, item):
+            # rendered straight to the publish location. there is nothing to
+            # map or copy, only check that the whole sequence is there.
+            with self._get_metrics(settings).step("verify"):
+                publish_files = self._get_in_place_files(settings, item)
+            logger.info(
+                "Work and publish paths are identical. Publishing %s files in "
+                "place." % (len(publish_files),)
+            )
+            if not self._get_checksum_algorithm(settings):
+                return None
+            # the checksums still have to be computed from the files
+            copy_pairs = [
+                (publish_file, publish_file) for publish_file in publish_files
+            ]
+        else:
+            copy_pairs = self._get_copy_pairs(settings, item)
+            if copy_pairs is None:
+                return None
+
+        # ---- copy the work files to the publish location
+
+        metrics = self._get_metrics(settings)
+        with metrics.step("copy"):
+            start_time = time.time()
+            checksums = self._copy_files(settings, copy_pairs)
+            copy_seconds = time.time() - start_time
+            copy_bytes = sum(
+                os.path.getsize(publish_file) for (_, publish_file) in copy_pairs
+            )
+            metrics.add(bytes=copy_bytes, frames=len(copy_pairs))
+
+        # remembered to estimate the duration of publish plans
+        if copy_bytes and copy_seconds:
+            _COPY_THROUGHPUT = copy_bytes / copy_seconds
+
+        # ---- record the checksums of the published files
+
+        if not checksums:
+            return None
+
+        checksum_algorithm = self._get_checksum_algorithm(settings)
+
+        if len(checksums) == 1:
+            checksum = list(checksums.values())[0]
+        else:
+            # the checksum of a sequence is the checksum of its manifest
+            hasher = _new_hasher(checksum_algorithm)
+            for publish_file in sorted(checksums):
+                hasher.update(
+                    (
+                        "%s  %s\n"
+                        % (checksums[publish_file], os.path.basename(publish_file))
+                    ).encode("utf-8")
+                )
+            checksum = hasher.hexdigest()
+
+        logger.info("Publish checksum: %s" % (checksum,))
+
+        if settings["Checksum Manifest"].value:
+            self._write_checksum_manifests(checksum_algorithm, checksums)
+
+        return "%s:%s" % (checksum_algorithm, checksum)
+
+    def _is_published_in_place(self, settings, item):
+        """
+        Returns True if the work and publish templates of the supplied item
+        resolve its path to itself, as for outputs rendered straight to the
+        publish location.
+
+        :param settings: This plugin instance's configured settings
+        :param item: The item to check
+        """
+        work_template = item.properties.get("work_template")
+        publish_template = self.get_publish_template(settings, item)
+        if not work_template or not publish_template:
+            return False
+
+        path = item.properties.path
+        publish_path = self.get_publish_path(settings, item)
+        return os.path.normcase(os.path.abspath(publish_path)) == os.path.normcase(
+            os.path.abspath(path)
+        )
+
+    def _get_frame_check(self, settings, item):
+        """
+        Return the check of the frames of the supplied item's sequence, made
+        by the collector when it found the frames of the sequence on disk.
+
+        :param settings: This plugin instance's configured settings
+        :param item: The item to check the frames of
+
+        :return: A dictionary of the "first_frame" and "last_frame" checked
+            and the lists of the "missing" and "short" frames, or None if
+            there is nothing to check.
+        """
+        return item.properties.get("frame_check")
+
+    def _get_in_place_files(self, settings, item):
+        """
+        Return the files of an item published in place.
+
+        The files of a sequence are the "sequence_paths" found by the
+        collector, restricted to the item's "first_frame" and "last_frame"
+        when the collector also found their frame numbers. The missing frames
+        were reported during the validation, see :meth:`_get_frame_check`.
+
+        :param settings: This plugin instance's configured settings
+        :param item: The item published in place
+
+        :return: The sorted list of the files of the item.
+        :raises Exception: If the file, or every frame of the sequence, is
+            missing.
+        """
+        path = item.properties.path
+
+        sequence_paths = item.properties.get("sequence_paths")
+        if not sequence_paths and not _is_sequence_path(path):
+            if not os.path.isfile(path):
+                raise Exception("The file to publish in place is missing: %s" % (path,))
+            self._get_metrics(settings).add(frames=1)
+            return [path]
+
+        files = list(sequence_paths or [])
+        frames = (item.properties.get("sequence_frames") or {}).get("frames")
+        first_frame = item.properties.get("first_frame")
+        last_frame = item.properties.get("last_frame")
+        if frames and first_frame is not None and last_frame is not None:
+            files = [
+                frame_path
+                for (frame, frame_path) in zip(frames, files)
+                if first_frame <= frame <= last_frame
+            ]
+        if not files:
+            raise Exception("No frames found for the sequence: %s" % (path,))
+
+        self._get_metrics(settings).add(frames=len(files))
+        return files
+
+    def _get_copy_pairs(self, settings, item):
+        """
+        Return the work files of the supplied item paired with the publish
+        files :meth:`_copy_work_to_publish` copies them to.
+
+        :param settings: This plugin instance's configured settings
+        :param item: The item to get the files of
+
+        :return: A list of (work file, publish file) tuples, or None if the
+            item is published in place.
         """
 
+        logger = self._get_copy_logger()
+
         # ---- ensure templates are available
         work_template = item.properties.get("work_template")
         if not work_template:
-            self.logger.debug(
+            logger.debug(
                 "No work template set on the item. "
                 "Skipping copy file to publish location."
             )
-            return
+            return None
 
         publish_template = self.get_publish_template(settings, item)
         if not publish_template:
-            self.logger.debug(
+            logger.debug(
                 "No publish template set on the item. "
                 "Skipping copying file to publish location."
             )
-            return
+            return None
 
         # ---- get a list of files to be copied
 
@@ -805,84 +1474,1059 @@ class BasicFilePublishPlugin(HookBaseClass):
         if "sequence_paths" in item.properties:
             work_files = item.properties.get("sequence_paths", [])
             if not work_files:
-                self.logger.warning(
+                logger.warning(
                     "Sequence publish without a list of files. Publishing "
                     "the sequence path in place: %s" % (item.properties.path,)
                 )
-                return
+                return None
 
-        # ---- copy the work files to the publish location
+        # ---- map the work files to their publish location
 
+        # the templates are only resolved for the first frame of a sequence.
+        # the publish path of the remaining frames is derived by substituting
+        # the frame number, falling back to the templates for any frame that
+        # doesn't follow the pattern.
+        frame_mapper = None
+
+        copy_pairs = []
         for work_file in work_files:
 
+            if frame_mapper:
+                publish_file = frame_mapper(work_file)
+                if publish_file:
+                    copy_pairs.append((work_file, publish_file))
+                    continue
+
             if not work_template.validate(work_file):
-                self.logger.warning(
+                logger.warning(
                     "Work file '%s' did not match work template '%s'. "
                     "Publishing in place." % (work_file, work_template)
                 )
-                return
+                return None
 
             work_fields = work_template.get_fields(work_file)
 
             missing_keys = publish_template.missing_keys(work_fields)
 
             if missing_keys:
-                self.logger.warning(
+                logger.warning(
                     "Work file '%s' missing keys required for the publish "
                     "template: %s" % (work_file, missing_keys)
                 )
-                return
+                return None
 
             publish_file = publish_template.apply_fields(work_fields)
+            copy_pairs.append((work_file, publish_file))
 
-            # copy the file
-            try:
-                publish_folder = os.path.dirname(publish_file)
-                ensure_folder_exists(publish_folder)
-                copy_file(work_file, publish_file)
-            except Exception:
-                raise Exception(
-                    "Failed to copy work file from '%s' to '%s'.\n%s"
-                    % (work_file, publish_file, traceback.format_exc())
+            if frame_mapper is None and len(work_files) > 1:
+                frame_mapper = (
+                    self._get_frame_mapper(work_template, publish_template, work_fields)
+                    or False
                 )
 
-            self.logger.debug(
-                "Copied work file '%s' to publish file '%s'."
-                % (work_file, publish_file)
-            )
+        return copy_pairs
 
-    def _get_next_version_info(self, path, item):
+    def _resolve_publish_type(self, settings, path):
         """
-        Return the next version of the supplied path.
-
-        If templates are configured, use template logic. Otherwise, fall back to
-        the zero configuration, path_info hook logic.
-
-        :param str path: A path with a version number.
-        :param item: The current item being published
+        Determine the publish type of the supplied path from its extension.
 
-        :return: A tuple of the form::
+        :param settings: This plugin instance's configured settings
+        :param str path: The path to determine the publish type for
 
-            # the first item is the supplied path with the version bumped by 1
-            # the second item is the new version number
-            (next_version_path, version)
+        :return: A publish type
         """
 
-        if not path:
-            self.logger.debug("Path is None. Can not determine version info.")
-            return None, None
-
         publisher = self.parent
 
-        # if the item has a known work file template, see if the path
-        # matches. if not, warn the user and provide a way to save the file to
-        # a different path
-        work_template = item.properties.get("work_template")
-        work_fields = None
+        # get the publish path components
+        path_info = publisher.util.get_file_path_components(path)
 
-        if work_template:
-            if work_template.validate(path):
+        # determine the publish type
+        extension = path_info["extension"]
+
+        # ensure lowercase and no dot
+        if extension:
+            extension = extension.lstrip(".").lower()
+
+            (file_type_index, max_parts) = self._get_file_type_index(settings)
+
+            # try the longest compound extension (ie. bgeo.sc) first
+            name_parts = os.path.basename(path).lower().split(".")[1:]
+            for num_parts in range(min(max_parts, len(name_parts)), 0, -1):
+                publish_type = file_type_index.get(".".join(name_parts[-num_parts:]))
+                if publish_type:
+                    # found a matching type in settings. use it!
+                    return publish_type
+
+        # --- no pre-defined publish type found...
+
+        if extension:
+            # publish type is based on extension
+            publish_type = "%s File" % extension.capitalize()
+        else:
+            # no extension, assume it is a folder
+            publish_type = "Folder"
+
+        return publish_type
+
+    def _get_file_type_index(self, settings):
+        """
+        Return an index of the extensions configured in the "File Types"
+        setting.
+
+        The index is built once and rebuilt only if the setting changes.
+
+        :param settings: This plugin instance's configured settings
+
+        :return: A tuple of a dictionary of lowercase extension (without a
+            leading dot) to publish type and the largest number of parts of
+            a compound extension (ie. 2 for bgeo.sc).
+        """
+
+        file_types = settings["File Types"].value
+
+        cached_index = getattr(self, "_file_type_index", None)
+        if cached_index and cached_index[0] == file_types:
+            return cached_index[1]
+
+        file_type_index = {}
+        for type_def in file_types:
+            publish_type = type_def[0]
+            for file_extension in type_def[1:]:
+                file_extension = file_extension.lstrip(".").lower()
+                # the first type listed for an extension wins
+                file_type_index.setdefault(file_extension, publish_type)
+
+        max_parts = max(
+            [extension.count(".") + 1 for extension in file_type_index] or [1]
+        )
+
+        # keep a copy of the setting to detect changes
+        self._file_type_index = (
+            [list(type_def) for type_def in file_types],
+            (file_type_index, max_parts),
+        )
+        return (file_type_index, max_parts)
+
+    def _get_resolution_cache(self, item):
+        """
+        Return the dictionary caching the resolved publish information of the
+        supplied item.
+
+        The cached values are keyed on the inputs they are resolved from (path,
+        templates, settings), so changing any of them on the item resolves the
+        value again.
+
+        :param item: The item to get the cache of
+        """
+        resolution_cache = getattr(self, "_resolution_cache", None)
+        if resolution_cache is None:
+            resolution_cache = self._resolution_cache = weakref.WeakKeyDictionary()
+        return resolution_cache.setdefault(item, {})
+
+    def _get_work_fields(self, item, work_template, path):
+        """
+        Return the fields of the supplied path extracted with the work
+        template, cached on the item. The "work_fields" set by the collector
+        for the item's path are used if available.
+
+        :param item: The item the path belongs to
+        :param work_template: The work template to extract the fields with
+        :param str path: The path to extract the fields from
+
+        :return: A new dictionary of fields, or None if the path doesn't match
+            the template.
+        """
+        cache = self._get_resolution_cache(item)
+        cache_key = ("work_fields", path, _template_key(work_template))
+        if cache_key not in cache:
+            work_fields = None
+            if (
+                item.properties.get("work_fields") is not None
+                and path == item.properties.get("path")
+                and work_template is item.properties.get("work_template")
+            ):
+                # already extracted by the collector
+                work_fields = item.properties["work_fields"]
+            elif work_template.validate(path):
                 work_fields = work_template.get_fields(path)
+            cache[cache_key] = work_fields
+
+        work_fields = cache[cache_key]
+        if work_fields is None:
+            return None
+        # return a copy so the caller can modify it
+        return dict(work_fields)
+
+    def _resolve_dependency_paths(self, dependency_paths):
+        """
+        Resolve the supplied dependency paths to the ids of their publishes.
+
+        The paths not looked up in the last minute are looked up with a
+        single :meth:`sgtk.util.find_publish` call. The paths no publish was
+        found for are kept too, so they aren't looked up again meanwhile.
+
+        :param list dependency_paths: The paths to resolve
+
+        :return: A tuple of the list of the ids of the publishes found, and
+            the list of the paths no publish was found for.
+        """
+
+        if not dependency_paths:
+            return ([], [])
+
+        normalized_paths = dict(
+            (path, sgtk.util.ShotgunPath.normalize(path)) for path in dependency_paths
+        )
+        # forget the publishes looked up too long ago
+        now = time.time()
+        for (normalized_path, (_, lookup_time)) in list(_DEPENDENCY_IDS.items()):
+            if now - lookup_time > _DEPENDENCY_CACHE_TIMEOUT:
+                del _DEPENDENCY_IDS[normalized_path]
+
+        unknown_paths = [
+            path
+            for path in dependency_paths
+            if normalized_paths[path] not in _DEPENDENCY_IDS
+        ]
+        if unknown_paths:
+            try:
+                publishes = sgtk.util.find_publish(
+                    self.parent.sgtk, unknown_paths, fields=["id"]
+                )
+            except Exception:
+                # let register_publish look them up
+                self.logger.debug(
+                    "Unable to look up the dependency publishes:\n%s"
+                    % (traceback.format_exc(),)
+                )
+                publishes = None
+            self._get_metrics().add(sg_calls=1)
+            if publishes is not None:
+                for path in unknown_paths:
+                    _DEPENDENCY_IDS[normalized_paths[path]] = (None, now)
+                for (path, publish) in publishes.items():
+                    _DEPENDENCY_IDS[sgtk.util.ShotgunPath.normalize(path)] = (
+                        publish["id"],
+                        now,
+                    )
+
+        resolved_ids = []
+        unresolved_paths = []
+        for path in dependency_paths:
+            (dependency_id, _) = _DEPENDENCY_IDS.get(
+                normalized_paths[path], (None, None)
+            )
+            if dependency_id is not None:
+                resolved_ids.append(dependency_id)
+            else:
+                unresolved_paths.append(path)
+
+        self.logger.debug(
+            "Resolved %s of %s dependency paths to publishes."
+            % (len(resolved_ids), len(dependency_paths))
+        )
+        return (resolved_ids, unresolved_paths)
+
+    def _get_accepted_items(self):
+        """
+        Return the set of items accepted by this plugin instance.
+
+        Items are held weakly so that items removed from the publish tree
+        aren't kept alive.
+        """
+        accepted_items = getattr(self, "_accepted_items", None)
+        if accepted_items is None:
+            accepted_items = self._accepted_items = weakref.WeakSet()
+        return accepted_items
+
+    def _get_conflicting_publishes(self, settings, item, publish_path, publish_name):
+        """
+        Return the publishes with a status that conflict with the publish of
+        the supplied item.
+
+        The conflicting publishes of all of the checked items accepted by this
+        plugin are looked up together the first time this is called during a
+        validation pass. The results for the other items are kept until their
+        own validation.
+
+        :param settings: This plugin instance's configured settings
+        :param item: The item to find the conflicting publishes of
+        :param str publish_path: The path the item will be published to
+        :param str publish_name: The name the item will be published with
+
+        :return: A list of publish dictionaries.
+        """
+
+        conflicting_publishes = getattr(self, "_conflicting_publishes", None)
+        if conflicting_publishes is None:
+            conflicting_publishes = weakref.WeakKeyDictionary()
+            self._conflicting_publishes = conflicting_publishes
+
+        key = (publish_path, publish_name)
+        prefetched = conflicting_publishes.pop(item, None)
+        if (
+            prefetched is None
+            or prefetched[0] != key
+            or time.time() - prefetched[2] > _CONFLICT_CACHE_TIMEOUT
+        ):
+            # start of a validation pass (or the item changed since the last
+            # pass). look up this item along with all the others.
+            conflicting_publishes.clear()
+            try:
+                conflicting_publishes.update(
+                    self._find_conflicting_publishes(settings, item)
+                )
+            except Exception:
+                self.logger.debug(
+                    "Unable to look up conflicting publishes in bulk:\n%s"
+                    % (traceback.format_exc(),)
+                )
+            prefetched = conflicting_publishes.pop(item, None)
+
+        if prefetched is not None and prefetched[0] == key:
+            return prefetched[1]
+
+        self._get_metrics().add(sg_calls=1)
+        return self.parent.util.get_conflicting_publishes(
+            item.context,
+            publish_path,
+            publish_name,
+            filters=["sg_status_list", "is_not", None],
+        )
+
+    def _find_conflicting_publishes(self, settings, item):
+        """
+        Find the conflicting publishes of the supplied item and of all the
+        other checked items in its publish tree accepted by this plugin, using
+        as few Shotgun queries as possible.
+
+        :param settings: This plugin instance's configured settings
+        :param item: The item being validated
+
+        :return: A dictionary of item to a ((publish path, publish name),
+            list of conflicting publishes, lookup time) tuple.
+        """
+
+        publisher = self.parent
+
+        # gather the checked items of the tree accepted by this plugin
+        root_item = item
+        while root_item.parent:
+            root_item = root_item.parent
+
+        accepted_items = self._get_accepted_items()
+        items = [item]
+        pending_items = list(root_item.children)
+        while pending_items:
+            tree_item = pending_items.pop(0)
+            pending_items.extend(tree_item.children)
+            if (
+                tree_item is not item
+                and tree_item in accepted_items
+                and getattr(tree_item, "checked", True)
+            ):
+                items.append(tree_item)
+
+        # compute the fields the publish of each item would be created with.
+        # a dry run of register_publish doesn't talk to Shotgun.
+        items_data = []
+        for tree_item in items:
+            publish_path = self.get_publish_path(settings, tree_item)
+            publish_name = self.get_publish_name(settings, tree_item)
+            publish_data = sgtk.util.register_publish(
+                publisher.sgtk,
+                tree_item.context,
+                publish_path,
+                publish_name,
+                version_number=None,
+                dry_run=True,
+            )
+            items_data.append((tree_item, (publish_path, publish_name), publish_data))
+
+        publish_entity_type = sgtk.util.get_published_file_entity_type(publisher.sgtk)
+
+        lookup_time = time.time()
+        results = {}
+        for start in range(0, len(items_data), _CONFLICT_QUERY_CHUNK_SIZE):
+            chunk = items_data[start : start + _CONFLICT_QUERY_CHUNK_SIZE]
+            filters = [
+                ["sg_status_list", "is_not", None],
+                _conflict_filter([publish_data for (_, _, publish_data) in chunk]),
+            ]
+            publishes = publisher.shotgun.find(
+                publish_entity_type,
+                filters,
+                _CONFLICT_FIELDS + ["path", "version_number", "sg_status_list"],
+            )
+            self._get_metrics().add(sg_calls=1)
+
+            # dispatch the publishes to the items they conflict with
+            for (tree_item, key, publish_data) in chunk:
+                item_key = _conflict_key(publish_data)
+                results[tree_item] = (
+                    key,
+                    _filter_publishes_by_path(
+                        publisher.sgtk,
+                        [p for p in publishes if _conflict_key(p) == item_key],
+                        key[0],
+                    ),
+                    lookup_time,
+                )
+
+        self.logger.debug(
+            "Looked up the conflicting publishes of %s items." % (len(items_data),)
+        )
+        return results
+
+    def _get_published_items(self):
+        """
+        Return a dictionary of the items published by this plugin instance
+        whose conflicting publishes haven't been cleared yet, to the
+        publish data registered for them.
+        """
+        published_items = getattr(self, "_published_items", None)
+        if published_items is None:
+            published_items = self._published_items = weakref.WeakKeyDictionary()
+        return published_items
+
+    def _get_pending_copies(self):
+        """
+        Return a dictionary of the items whose files are being copied in the
+        background by this plugin instance, to the state of their copy.
+        """
+        pending_copies = getattr(self, "_pending_copies", None)
+        if pending_copies is None:
+            pending_copies = self._pending_copies = weakref.WeakKeyDictionary()
+        return pending_copies
+
+    def _clear_status_for_conflicting_publishes(self, item, publish_data):
+        """
+        Clear the status of the publishes conflicting with the supplied
+        publish.
+
+        The first item finalized waits for the files of every item published
+        by this plugin to be copied, then clears their conflicting publishes
+        with a single query and batch update. The following items are then
+        already taken care of.
+
+        :param item: The item being finalized
+        :param dict publish_data: The publish registered for the item
+        """
+
+        cleared_items = getattr(self, "_cleared_items", None)
+        if cleared_items is None:
+            cleared_items = self._cleared_items = weakref.WeakKeyDictionary()
+
+        if cleared_items.pop(item, None) == publish_data["id"]:
+            self.logger.debug("Conflicting publishes already cleared in bulk.")
+            return
+
+        # wait for the pipelined copies of the other items. the publishes whose
+        # copy failed are left alone, their own finalize reports the failure.
+        failed_items = set()
+        for (copying_item, publish_copy) in list(self._get_pending_copies().items()):
+            publish_copy["thread"].join()
+            if publish_copy["error"]:
+                failed_items.add(copying_item)
+
+        published_items = self._get_published_items()
+        published_items[item] = publish_data
+        items_data = [
+            (published_item, published_data)
+            for (published_item, published_data) in list(published_items.items())
+            if published_item not in failed_items
+            and all(field in published_data for field in _CONFLICT_FIELDS + ["path"])
+        ]
+        published_items.clear()
+
+        if item not in [published_item for (published_item, _) in items_data]:
+            # not enough information to clear in bulk. the util looks the
+            # conflicting publishes up, then updates them in a batch.
+            self.parent.util.clear_status_for_conflicting_publishes(
+                item.context, publish_data
+            )
+            self._get_metrics().add(sg_calls=2)
+            return
+
+        self._clear_status_for_all_conflicting_publishes(items_data)
+
+        for (published_item, published_data) in items_data:
+            if published_item is not item:
+                cleared_items[published_item] = published_data["id"]
+
+    def _clear_status_for_all_conflicting_publishes(self, items_data):
+        """
+        Clear the status of the publishes conflicting with any of the supplied
+        publishes, with as few Shotgun calls as possible.
+
+        :param list items_data: A list of (item, publish data) tuples
+        """
+
+        publisher = self.parent
+        metrics = self._get_metrics()
+
+        publish_entity_type = sgtk.util.get_published_file_entity_type(publisher.sgtk)
+
+        # find the conflicting publishes of all the items
+        conflicting_ids = set()
+        for start in range(0, len(items_data), _CONFLICT_QUERY_CHUNK_SIZE):
+            chunk = items_data[start : start + _CONFLICT_QUERY_CHUNK_SIZE]
+            filters = [
+                ["sg_status_list", "is_not", None],
+                _conflict_filter([publish_data for (_, publish_data) in chunk]),
+            ]
+            publishes = publisher.shotgun.find(
+                publish_entity_type, filters, _CONFLICT_FIELDS + ["path"]
+            )
+            metrics.add(sg_calls=1)
+
+            for (_, publish_data) in chunk:
+                item_key = _conflict_key(publish_data)
+                conflicting_ids.update(
+                    p["id"]
+                    for p in _filter_publishes_by_path(
+                        publisher.sgtk,
+                        [p for p in publishes if _conflict_key(p) == item_key],
+                        publish_data["path"]["local_path"],
+                    )
+                    if p["id"] != publish_data["id"]
+                )
+
+        # and clear their status in as few batch calls as possible
+        batch_data = [
+            {
+                "request_type": "update",
+                "entity_type": publish_entity_type,
+                "entity_id": publish_id,
+                "data": {"sg_status_list": None},
+            }
+            for publish_id in sorted(conflicting_ids)
+        ]
+        for start in range(0, len(batch_data), _SHOTGUN_BATCH_SIZE):
+            publisher.shotgun.batch(batch_data[start : start + _SHOTGUN_BATCH_SIZE])
+            metrics.add(sg_calls=1)
+
+        self.logger.debug(
+            "Cleared the status of %s publishes conflicting with %s items."
+            % (len(batch_data), len(items_data))
+        )
+
+    def _start_copy_work_to_publish(self, settings, item):
+        """
+        Run :meth:`_copy_work_to_publish` for the supplied item in a background
+        thread.
+
+        The state of the copy is stored in the item's ``publish_copy`` local
+        property, to be waited on with :meth:`_finish_copy_work_to_publish`.
+        The checksum of the copy and the records logged by it are kept in
+        that state until then.
+
+        :param settings: This plugin instance's configured settings
+        :param item: The item to copy the files of
+        """
+
+        # the thread doesn't touch the item, its local properties belong to
+        # the plugin active at the time. it doesn't log either, the
+        # publisher's log handler isn't thread safe.
+        publish_copy = {"error": None, "checksum": None, "logger": _DeferredLogger()}
+        metrics = self._get_metrics(settings)
+        # account the copy to the publish phase starting it
+        measurement = metrics.current()
+
+        def copy_work_to_publish():
+            metrics.attach(measurement)
+            _BACKGROUND_COPY.logger = publish_copy["logger"]
+            try:
+                publish_copy["checksum"] = self._copy_work_to_publish(settings, item)
+            except Exception:
+                publish_copy["error"] = traceback.format_exc()
+            finally:
+                _BACKGROUND_COPY.logger = None
+
+        thread = threading.Thread(target=copy_work_to_publish)
+        thread.daemon = True
+        publish_copy["thread"] = thread
+        item.local_properties["publish_copy"] = publish_copy
+        self._get_pending_copies()[item] = publish_copy
+
+        self.logger.info("Copying files to the publish location in the background...")
+        thread.start()
+
+    def _finish_copy_work_to_publish(self, settings, item):
+        """
+        Wait for the background copy started by
+        :meth:`_start_copy_work_to_publish` and update the status of the
+        publish accordingly.
+
+        If the copy failed, the status of the publish is cleared so that it
+        isn't picked up by other users and an exception is raised.
+
+        :param settings: This plugin instance's configured settings
+        :param item: The item the files were copied for
+        """
+
+        publisher = self.parent
+        publish_data = item.properties.sg_publish_data
+        publish_copy = item.local_properties["publish_copy"]
+
+        self.logger.info("Waiting for the files to be copied...")
+        publish_copy["thread"].join()
+        item.local_properties["publish_copy"] = None
+        self._get_pending_copies().pop(item, None)
+        publish_copy["logger"].flush(self.logger)
+        item.local_properties["publish_checksum"] = publish_copy["checksum"]
+
+        if publish_copy["error"]:
+            publisher.shotgun.update(
+                publish_data["type"], publish_data["id"], {"sg_status_list": None}
+            )
+            self._get_metrics(settings).add(sg_calls=1)
+            raise Exception(
+                "Failed to copy the files of the publish. Its status has been "
+                "cleared.\n%s" % (publish_copy["error"],)
+            )
+
+        update_data = {"sg_status_list": settings["Published Status"].value}
+        # the checksum is only known now that the copy has finished
+        publish_fields = self.get_publish_fields(settings, item)
+        checksum_field = settings["Checksum Field"].value
+        if checksum_field in publish_fields:
+            update_data[checksum_field] = publish_fields[checksum_field]
+
+        publisher.shotgun.update(publish_data["type"], publish_data["id"], update_data)
+        self._get_metrics(settings).add(sg_calls=1)
+        self.logger.info("Files copied. Publish status updated.")
+
+    def _get_copy_logger(self):
+        """
+        Return the logger to use for the copy of the publish files: the
+        logger of the background copy running in the current thread, if any,
+        otherwise the plugin's logger.
+        """
+        return getattr(_BACKGROUND_COPY, "logger", None) or self.logger
+
+    def _get_frame_mapper(self, work_template, publish_template, work_fields):
+        """
+        Build a function mapping the frames of a work sequence to their
+        publish paths without going through the templates.
+
+        :param work_template: The template the work files match
+        :param publish_template: The template for the publish files
+        :param dict work_fields: The fields extracted from one frame of the
+            sequence
+
+        :return: A function taking a work file path and returning its publish
+            path, or None if the work file doesn't follow the sequence pattern.
+            Returns None instead of a function if the templates can't be
+            mapped this way.
+        """
+
+        logger = self._get_copy_logger()
+
+        if "SEQ" not in work_fields:
+            return None
+
+        # resolve the templates with a frame specifier (ie. %04d) in place of
+        # the frame number
+        seq_fields = dict(work_fields)
+        seq_fields["SEQ"] = "FORMAT: %d"
+        try:
+            work_pattern = work_template.apply_fields(seq_fields)
+            publish_pattern = publish_template.apply_fields(seq_fields)
+        except Exception:
+            logger.debug(
+                "Unable to resolve the frame specifier of the sequence:\n%s"
+                % (traceback.format_exc(),)
+            )
+            return None
+
+        # only handle paths with a single frame specifier and no other "%"
+        work_match = _FRAME_SPEC_REGEX.search(work_pattern)
+        if (
+            not work_match
+            or work_pattern.count("%") != 1
+            or publish_pattern.count("%") != 1
+            or not _FRAME_SPEC_REGEX.search(publish_pattern)
+        ):
+            return None
+
+        work_spec = work_match.group(0)
+        work_regex = re.compile(
+            r"%s(\d+)%s$"
+            % (
+                re.escape(work_pattern[: work_match.start()]),
+                re.escape(work_pattern[work_match.end() :]),
+            )
+        )
+
+        def frame_mapper(work_file):
+            match = work_regex.match(work_file)
+            if not match:
+                return None
+            frame = int(match.group(1))
+            # make sure the frame is padded the way the template expects
+            if work_spec % (frame,) != match.group(1):
+                return None
+            return publish_pattern % (frame,)
+
+        return frame_mapper
+
+    def _copy_files(self, settings, copy_pairs):
+        """
+        Copy the supplied (work file, publish file) pairs, using the number of
+        threads configured in the "Copy Workers" setting.
+
+        All of the pairs are attempted before any failure is reported. If one
+        or more files fail to copy, a single exception listing every failure is
+        raised so that the publish fails.
+
+        :param settings: This plugin instance's configured settings
+        :param list copy_pairs: A list of (work file, publish file) tuples
+
+        :return: A dictionary of publish file to its checksum. Empty unless a
+            "Checksum Algorithm" is configured.
+        """
+
+        logger = self._get_copy_logger()
+
+        checksums = {}
+
+        if not copy_pairs:
+            return checksums
+
+        # create the publish folders up front so the workers don't race to
+        # create the same folder
+        publish_folders = set(
+            os.path.dirname(publish_file) for (_, publish_file) in copy_pairs
+        )
+        for publish_folder in publish_folders:
+            try:
+                ensure_folder_exists(publish_folder)
+            except Exception:
+                raise Exception(
+                    "Failed to create publish folder '%s'.\n%s"
+                    % (publish_folder, traceback.format_exc())
+                )
+
+        transfer_mode = settings["Transfer Mode"].value
+        if transfer_mode not in _TRANSFER_MODES:
+            raise Exception(
+                "Invalid transfer mode '%s'. Expected one of: %s"
+                % (transfer_mode, ", ".join(_TRANSFER_MODES))
+            )
+
+        checksum_algorithm = self._get_checksum_algorithm(settings)
+
+        journals = {}
+        if settings["Resume Copies"].value:
+            journal_algorithm = None
+            if settings["Resume Verify Hash"].value:
+                journal_algorithm = checksum_algorithm or "blake2b"
+            for publish_folder in publish_folders:
+                journals[publish_folder] = _CopyJournal(
+                    publish_folder, journal_algorithm
+                )
+
+            remaining_pairs = []
+            for (work_file, publish_file) in copy_pairs:
+                journal = journals[os.path.dirname(publish_file)]
+                if not journal.is_copied(work_file, publish_file):
+                    remaining_pairs.append((work_file, publish_file))
+                elif checksum_algorithm:
+                    checksums[publish_file] = journal.get_checksum(
+                        publish_file, checksum_algorithm
+                    ) or _file_hash(publish_file, checksum_algorithm)
+
+            if len(remaining_pairs) != len(copy_pairs):
+                logger.info(
+                    "Skipping %s files already copied by a previous publish."
+                    % (len(copy_pairs) - len(remaining_pairs),)
+                )
+            copy_pairs = remaining_pairs
+            if not copy_pairs:
+                _remove_journals(journals)
+                return checksums
+
+        # the sizes schedule the copies and pace them against the bandwidth
+        # limit. each work folder is listed once.
+        folder_sizes = {}
+        file_sizes = {}
+        for (work_file, _) in copy_pairs:
+            (work_folder, work_name) = os.path.split(work_file)
+            if work_folder not in folder_sizes:
+                folder_sizes[work_folder] = _get_file_sizes(work_folder)
+            file_sizes[work_file] = folder_sizes[work_folder].get(work_name, 0)
+
+        bandwidth_limiter = None
+        bandwidth_limit = settings["Copy Bandwidth Limit"].value
+        if bandwidth_limit > 0:
+            bandwidth_limiter = _get_bandwidth_limiter(bandwidth_limit * 1024 * 1024)
+
+        copy_options = {
+            "transfer_mode": transfer_mode,
+            "journals": journals,
+            "checksum_algorithm": checksum_algorithm,
+            "checksums": checksums,
+            "file_sizes": file_sizes,
+            "bandwidth_limiter": bandwidth_limiter,
+            "block_size": max(1, settings["Copy Block Size"].value) * 1024,
+            "use_sendfile": settings["Use Sendfile"].value,
+            "read_ahead": settings["Copy Read Ahead"].value,
+            "fallbacks": [],
+        }
+        copy_file_func = functools.partial(self._copy_file, copy_options)
+        workers = max(1, min(settings["Copy Workers"].value, len(copy_pairs)))
+
+        logger.debug("Copying %s files using %s workers." % (len(copy_pairs), workers))
+        scheduler = _CopyScheduler(
+            workers,
+            adaptive=settings["Adaptive Copy Workers"].value,
+            priority_size=settings["Priority File Size"].value * 1024,
+            bandwidth_limiter=bandwidth_limiter,
+        )
+        errors = scheduler.run(
+            copy_file_func,
+            [
+                (file_sizes[work_file], (work_file, publish_file))
+                for (work_file, publish_file) in copy_pairs
+            ],
+        )
+
+        # the copy threads don't log, the publisher's log handler isn't
+        # thread safe. summarize what they did instead.
+        fallbacks = {}
+        for fallback in copy_options["fallbacks"]:
+            fallbacks[fallback] = fallbacks.get(fallback, 0) + 1
+        for ((mode, error), count) in sorted(fallbacks.items()):
+            logger.debug(
+                "Could not %s %s files: %s. Fell back to the next transfer mode."
+                % (mode, count, error)
+            )
+        for (latency, allowed) in scheduler.concurrency_changes:
+            logger.debug(
+                "Copy latency %.1f ms/MB, copying %s files at once."
+                % (latency * 1024 * 1024 * 1000, allowed)
+            )
+
+        errors = [error for error in errors if error]
+        if errors:
+            raise Exception(
+                "Failed to copy %s of %s work files to the publish location.\n%s"
+                % (len(errors), len(copy_pairs), "\n".join(errors))
+            )
+        logger.debug(
+            "Copied %s work files to the publish location." % (len(copy_pairs),)
+        )
+
+        if settings["Sync Copies"].value:
+            logger.debug("Syncing the published files...")
+            _sync_files([publish_file for (_, publish_file) in copy_pairs])
+
+        # the journals are only needed to resume an interrupted copy
+        _remove_journals(journals)
+
+        return checksums
+
+    def _copy_file(self, copy_options, copy_pair):
+        """
+        Transfer a single work file to its publish location.
+
+        The transfer modes are tried in the order returned by
+        :meth:`_get_transfer_modes`. A mode that is not supported for the
+        supplied paths falls through to the next one, ending with a regular
+        copy.
+
+        When a checksum algorithm is configured, a regular copy computes the
+        checksum while the data is copied. The other transfer modes don't read
+        the data, so the publish file is read once to compute it.
+
+        :param dict copy_options: A dictionary with the "transfer_mode",
+            "journals" (publish folder to :class:`_CopyJournal`),
+            "checksum_algorithm", "checksums" (publish file to checksum, to
+            be filled in), "file_sizes" (work file to size),
+            "bandwidth_limiter" (a :class:`_BandwidthLimiter` or None),
+            "block_size", "use_sendfile" and "read_ahead" to use for the copy,
+            and "fallbacks", a list the (transfer mode, error) of each
+            transfer falling back to the next mode is appended to. This runs
+            in the copy threads, which don't log.
+        :param tuple copy_pair: A (work file, publish file) tuple
+
+        :return: None on success, otherwise a string describing the failure.
+        """
+
+        (work_file, publish_file) = copy_pair
+        checksum_algorithm = copy_options["checksum_algorithm"]
+        checksum = None
+
+        try:
+            if os.path.exists(publish_file) and os.path.samefile(
+                work_file, publish_file
+            ):
+                if os.path.normcase(os.path.abspath(work_file)) == os.path.normcase(
+                    os.path.abspath(publish_file)
+                ):
+                    # publishing in place, nothing to transfer
+                    if checksum_algorithm:
+                        copy_options["checksums"][publish_file] = _file_hash(
+                            publish_file, checksum_algorithm
+                        )
+                    return None
+                # a previous hardlink publish. break the link so that writing
+                # the publish file can't modify the work file.
+                os.remove(publish_file)
+
+            bandwidth_limiter = copy_options["bandwidth_limiter"]
+            for mode in self._get_transfer_modes(
+                copy_options["transfer_mode"], work_file, publish_file
+            ):
+                if bandwidth_limiter and mode in ("copy", "copy_file_range"):
+                    # the data goes through the storage. links and clones
+                    # don't use any bandwidth.
+                    bandwidth_limiter.consume(copy_options["file_sizes"][work_file])
+                    bandwidth_limiter = None
+                if mode == "copy":
+                    checksum = _copy_data(
+                        work_file,
+                        publish_file,
+                        copy_options["block_size"],
+                        use_sendfile=copy_options["use_sendfile"],
+                        read_ahead=copy_options["read_ahead"],
+                        algorithm=checksum_algorithm,
+                    )
+                    break
+                try:
+                    _transfer_file(mode, work_file, publish_file)
+                    break
+                except (IOError, OSError) as e:
+                    copy_options["fallbacks"].append((mode, e.strerror or str(e)))
+
+            if checksum_algorithm and not checksum:
+                checksum = _file_hash(publish_file, checksum_algorithm)
+            if checksum:
+                copy_options["checksums"][publish_file] = checksum
+
+            journal = copy_options["journals"].get(os.path.dirname(publish_file))
+            if journal:
+                journal.record(work_file, publish_file, checksum_algorithm, checksum)
+        except Exception:
+            return "Failed to copy work file from '%s' to '%s'.\n%s" % (
+                work_file,
+                publish_file,
+                traceback.format_exc(),
+            )
+
+    def _get_checksum_algorithm(self, settings):
+        """
+        Return the configured checksum algorithm, or None if checksums are
+        disabled.
+
+        :param settings: This plugin instance's configured settings
+
+        :raises Exception: If the algorithm is not available.
+        """
+
+        checksum_algorithm = settings["Checksum Algorithm"].value
+        if not checksum_algorithm or checksum_algorithm == "none":
+            return None
+
+        try:
+            _new_hasher(checksum_algorithm)
+        except ValueError as e:
+            raise Exception("Invalid checksum algorithm: %s" % (e,))
+
+        return checksum_algorithm
+
+    def _write_checksum_manifests(self, checksum_algorithm, checksums):
+        """
+        Write a manifest listing the checksum of each publish file to each
+        publish folder.
+
+        The manifest uses the same layout as the ``sha1sum`` family of tools:
+        one "<checksum>  <file name>" line per file.
+
+        :param str checksum_algorithm: The algorithm the checksums were
+            computed with
+        :param dict checksums: A dictionary of publish file to checksum
+        """
+
+        logger = self._get_copy_logger()
+
+        manifests = {}
+        for publish_file in sorted(checksums):
+            manifests.setdefault(os.path.dirname(publish_file), []).append(
+                "%s  %s\n" % (checksums[publish_file], os.path.basename(publish_file))
+            )
+
+        for (publish_folder, lines) in manifests.items():
+            manifest_path = os.path.join(
+                publish_folder, _CHECKSUM_MANIFEST_NAME % (checksum_algorithm,)
+            )
+            with open(manifest_path, "w") as manifest_file:
+                manifest_file.writelines(lines)
+            logger.debug("Wrote checksum manifest: %s" % (manifest_path,))
+
+    def _get_transfer_modes(self, transfer_mode, work_file, publish_file):
+        """
+        Return the ordered list of transfer modes to try for a file.
+
+        :param str transfer_mode: The configured "Transfer Mode" setting
+        :param str work_file: The file to transfer
+        :param str publish_file: The destination of the transfer
+
+        :return: A list of transfer modes, always ending with "copy"
+        """
+
+        if transfer_mode == "copy":
+            return ["copy"]
+
+        if transfer_mode != "auto":
+            return [transfer_mode, "copy"]
+
+        # in auto mode, only use the cheap operations when the work and publish
+        # files live on the same device. These keep the publish independent
+        # of any later change to the work file.
+        work_device = os.stat(work_file).st_dev
+        publish_device = os.stat(os.path.dirname(publish_file)).st_dev
+        if work_device == publish_device:
+            return ["reflink", "copy_file_range", "copy"]
+
+        return ["copy"]
+
+    def _get_next_version_info(self, path, item):
+        """
+        Return the next version of the supplied path.
+
+        If templates are configured, use template logic. Otherwise, fall back to
+        the zero configuration, path_info hook logic.
+
+        :param str path: A path with a version number.
+        :param item: The current item being published
+
+        If templates are configured, the next version is one more than the
+        highest version of the path found in its folder on disk.
+
+        :return: A tuple of the form::
+
+            # the first item is the supplied path with the version bumped
+            # the second item is the new version number
+            (next_version_path, version)
+        """
+
+        if not path:
+            self.logger.debug("Path is None. Can not determine version info.")
+            return None, None
+
+        publisher = self.parent
+
+        # if the item has a known work file template, see if the path
+        # matches. if not, warn the user and provide a way to save the file to
+        # a different path
+        work_template = item.properties.get("work_template")
+        work_fields = None
+
+        if work_template:
+            work_fields = self._get_work_fields(item, work_template, path)
 
         # if we have template and fields, use them to determine the version info
         if work_fields and "version" in work_fields:
@@ -890,6 +2534,16 @@ class BasicFilePublishPlugin(HookBaseClass):
             # template matched. bump version number and re-apply to the template
             work_fields["version"] += 1
             next_version_path = work_template.apply_fields(work_fields)
+
+            # when the versions live side by side in the same folder, jump
+            # straight past the highest version on disk
+            folder = os.path.dirname(path)
+            if os.path.dirname(next_version_path) == folder:
+                versions = self._get_folder_versions(work_template, folder, work_fields)
+                if versions and max(versions) >= work_fields["version"]:
+                    work_fields["version"] = max(versions) + 1
+                    next_version_path = work_template.apply_fields(work_fields)
+
             version = work_fields["version"]
 
         # fall back to the "zero config" logic
@@ -903,6 +2557,52 @@ class BasicFilePublishPlugin(HookBaseClass):
 
         return next_version_path, version
 
+    def _get_folder_versions(self, work_template, folder, work_fields):
+        """
+        Return the versions of the files in the supplied folder that match the
+        work template and the supplied fields, ignoring the version.
+
+        The folder is listed once and the fields of its files are cached until
+        the modification time of the folder changes.
+
+        :param work_template: The template of the versioned files
+        :param str folder: The folder to look for versions in
+        :param dict work_fields: The fields the files must match
+
+        :return: A list of version numbers.
+        """
+
+        folder_index = getattr(self, "_folder_version_index", None)
+        if folder_index is None:
+            folder_index = self._folder_version_index = {}
+
+        try:
+            folder_mtime = os.stat(folder).st_mtime
+        except OSError:
+            return []
+
+        index_key = (folder, _template_key(work_template))
+        cached = folder_index.get(index_key)
+        if not cached or cached[0] != folder_mtime:
+            self.logger.debug("Scanning folder for versions: %s" % (folder,))
+            files_fields = []
+            for file_name in _list_files(folder):
+                file_path = os.path.join(folder, file_name)
+                if work_template.validate(file_path):
+                    files_fields.append(work_template.get_fields(file_path))
+            cached = folder_index[index_key] = (folder_mtime, files_fields)
+
+        return [
+            file_fields["version"]
+            for file_fields in cached[1]
+            if "version" in file_fields
+            and all(
+                file_fields.get(key) == value
+                for (key, value) in work_fields.items()
+                if key != "version"
+            )
+        ]
+
     def _save_to_next_version(self, path, item, save_callback):
         """
         Save the supplied path to the next version on disk.
@@ -950,3 +2650,714 @@ class BasicFilePublishPlugin(HookBaseClass):
         self.logger.info("File saved as: %s" % (next_version_path,))
 
         return next_version_path
+
+
+def _list_files(folder):
+    """
+    Return the names of the files in the supplied folder, listing it once.
+    """
+    scandir = getattr(os, "scandir", None)
+    if scandir is None:
+        # python 2
+        return [
+            name
+            for name in os.listdir(folder)
+            if os.path.isfile(os.path.join(folder, name))
+        ]
+    return [entry.name for entry in scandir(folder) if entry.is_file()]
+
+
+def _is_sequence_path(path):
+    """
+    Return whether the supplied path has a frame specifier, ie. ``%04d`` or
+    ``####``.
+    """
+    return bool(_FRAME_SPEC_REGEX.search(path)) or "#" in path
+
+
+def _format_frame_ranges(frames):
+    """
+    Format the supplied sorted frame numbers as a compact list of ranges, ie.
+    ``1001-1003, 1010``.
+    """
+    ranges = []
+    for frame in frames:
+        if ranges and frame == ranges[-1][1] + 1:
+            ranges[-1][1] = frame
+        else:
+            ranges.append([frame, frame])
+    return ", ".join(
+        "%s-%s" % (first, last) if first != last else str(first)
+        for (first, last) in ranges
+    )
+
+
+def _get_file_sizes(folder):
+    """
+    Return a dictionary of file name to size of the files in the supplied
+    folder, listing it once. Empty if the folder doesn't exist.
+    """
+    scandir = getattr(os, "scandir", None)
+    try:
+        if scandir is None:
+            # python 2
+            file_sizes = {}
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if os.path.isfile(path):
+                    file_sizes[name] = os.path.getsize(path)
+            return file_sizes
+        return dict(
+            (entry.name, entry.stat().st_size)
+            for entry in scandir(folder)
+            if entry.is_file()
+        )
+    except OSError:
+        return {}
+
+
+def _get_disk_space(path):
+    """
+    Return the device and the free space, in bytes, of the filesystem the
+    supplied path is on, or would be created on if it doesn't exist yet.
+    Returns (None, None) if unknown.
+    """
+    while not os.path.exists(path):
+        parent_path = os.path.dirname(path)
+        if parent_path == path:
+            return (None, None)
+        path = parent_path
+
+    try:
+        device = os.stat(path).st_dev
+        disk_usage = getattr(shutil, "disk_usage", None)
+        if disk_usage:
+            return (device, disk_usage(path).free)
+        # python 2
+        stat = os.statvfs(path)
+        return (device, stat.f_bavail * stat.f_frsize)
+    except (AttributeError, OSError):
+        return (None, None)
+
+
+def _template_key(template):
+    """
+    Return a hashable key identifying the supplied template, or None.
+    """
+    if not template:
+        return None
+    # the representation includes the name and definition of the template
+    return repr(template)
+
+
+def _conflict_filter(publishes_data):
+    """
+    Return a Shotgun filter matching the publishes that conflict with any of
+    the supplied publishes.
+
+    :param list publishes_data: A list of publish entity or register_publish
+        dry run dictionaries
+    """
+    return {
+        "filter_operator": "any",
+        "filters": [
+            {
+                "filter_operator": "all",
+                "filters": [
+                    [field, "is", publish_data[field]] for field in _CONFLICT_FIELDS
+                ],
+            }
+            for publish_data in publishes_data
+        ],
+    }
+
+
+def _conflict_key(publish_data):
+    """
+    Return a hashable key of the fields identifying publishes of the same file.
+
+    :param dict publish_data: A publish entity or register_publish dry run
+        dictionary
+    """
+    key = []
+    for field in _CONFLICT_FIELDS:
+        value = publish_data.get(field)
+        if isinstance(value, dict):
+            value = (value.get("type"), value.get("id"))
+        key.append(value)
+    return tuple(key)
+
+
+def _filter_publishes_by_path(tk, publishes, path):
+    """
+    Return the supplied publishes whose path resolves to the supplied path.
+
+    :param tk: The toolkit instance the publishes belong to
+    :param list publishes: A list of publish entities with their path field
+    :param str path: The path the publishes should have
+    """
+    path = sgtk.util.ShotgunPath.normalize(path)
+    matching_publishes = []
+    for publish in publishes:
+        publish_path = sgtk.util.resolve_publish_path(tk, publish)
+        # compare the normalized paths, like the publisher util does
+        if publish_path and sgtk.util.ShotgunPath.normalize(publish_path) == path:
+            matching_publishes.append(publish)
+    return matching_publishes
+
+
+def _remove_journals(journals):
+    """
+    Remove the supplied copy journals once all of their files are copied.
+
+    :param dict journals: A dictionary of publish folder to
+        :class:`_CopyJournal`
+    """
+    for journal in journals.values():
+        journal.remove()
+
+
+class _CopyJournal(object):
+    """
+    Append-only record of the files copied to a publish folder.
+
+    Each line of the journal is a json dictionary describing a copied file.
+    Lines are appended as soon as a file has been copied so that a publish
+    that dies part way through still leaves an accurate record behind. The
+    journal is removed once all the files of the publish are copied.
+    """
+
+    def __init__(self, folder, hash_algorithm):
+        """
+        :param str folder: The publish folder the journal belongs to
+        :param str hash_algorithm: The algorithm used to store and verify
+            file hashes, or None to only compare sizes and modification times.
+        """
+        self.path = os.path.join(folder, _COPY_JOURNAL_NAME)
+        self._hash_algorithm = hash_algorithm
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r") as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # most likely a line cut short by an interrupted publish
+                    continue
+                self._entries[entry["name"]] = entry
+
+    def is_copied(self, work_file, publish_file):
+        """
+        Returns True if the journal shows ``work_file`` was already copied to
+        ``publish_file`` and neither file has changed since.
+        """
+        entry = self._entries.get(os.path.basename(publish_file))
+        if not entry or entry["source"] != work_file:
+            return False
+
+        try:
+            work_stat = os.stat(work_file)
+            publish_stat = os.stat(publish_file)
+        except OSError:
+            return False
+
+        if (
+            work_stat.st_size != entry["source_size"]
+            or work_stat.st_mtime != entry["source_mtime"]
+            or publish_stat.st_size != entry["size"]
+            or publish_stat.st_mtime != entry["mtime"]
+        ):
+            return False
+
+        if self._hash_algorithm:
+            checksum = self.get_checksum(publish_file, self._hash_algorithm)
+            if checksum != _file_hash(publish_file, self._hash_algorithm):
+                return False
+
+        return True
+
+    def get_checksum(self, publish_file, algorithm):
+        """
+        Returns the checksum recorded for ``publish_file`` with the supplied
+        algorithm, or None if there isn't one.
+        """
+        entry = self._entries.get(os.path.basename(publish_file)) or {}
+        if entry.get("hash_algorithm") != algorithm:
+            return None
+        return entry.get("hash")
+
+    def record(self, work_file, publish_file, algorithm=None, checksum=None):
+        """
+        Append an entry for a completed copy to the journal.
+
+        The supplied checksum is stored as is. If the journal verifies hashes
+        and no checksum with a usable algorithm is supplied, one is computed.
+        """
+        work_stat = os.stat(work_file)
+        publish_stat = os.stat(publish_file)
+        entry = {
+            "name": os.path.basename(publish_file),
+            "source": work_file,
+            "source_size": work_stat.st_size,
+            "source_mtime": work_stat.st_mtime,
+            "size": publish_stat.st_size,
+            "mtime": publish_stat.st_mtime,
+        }
+        if self._hash_algorithm and (not checksum or algorithm != self._hash_algorithm):
+            algorithm = self._hash_algorithm
+            checksum = _file_hash(publish_file, algorithm)
+        if checksum:
+            entry["hash_algorithm"] = algorithm
+            entry["hash"] = checksum
+
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self._entries[entry["name"]] = entry
+            with open(self.path, "a") as journal_file:
+                journal_file.write(line)
+
+    def remove(self):
+        """
+        Remove the journal file, if any.
+        """
+        with self._lock:
+            self._entries = {}
+            try:
+                os.remove(self.path)
+            except OSError:
+                # nothing was recorded
+                pass
+
+
+class _CopyScheduler(object):
+    """
+    Runs the copies of a publish on a number of threads.
+
+    Files smaller than the priority size are copied first and can always use
+    any idle thread. With adaptive concurrency, the number of larger files
+    copied at once starts at half the number of threads. It is increased one
+    at a time while the time taken to copy a byte stays close to the fastest
+    observed, and halved whenever it climbs well above it.
+    """
+
+    def __init__(
+        self,
+        workers,
+        adaptive=True,
+        priority_size=0,
+        bandwidth_limiter=None,
+    ):
+        """
+        :param int workers: The maximum number of files copied at once
+        :param bool adaptive: Whether to adapt the number of larger files
+            copied at once to the copy latency
+        :param int priority_size: Files smaller than this size, in bytes, are
+            copied first
+        :param bandwidth_limiter: The :class:`_BandwidthLimiter` the copies
+            wait on, if any. The time spent waiting doesn't count towards the
+            copy latency.
+        """
+        self._workers = workers
+        self._adaptive = adaptive
+        self._priority_size = priority_size
+        self._bandwidth_limiter = bandwidth_limiter
+        # the (latency in seconds per byte, files copied at once) of each
+        # concurrency change, to be reported once the copies are done
+        self.concurrency_changes = []
+        self._condition = threading.Condition()
+        # adaptive concurrency starts half way so that the latency of the
+        # unsaturated storage is observed before ramping up
+        self._allowed = max(1, workers // 2) if adaptive else workers
+        self._active = 0
+        self._latency = None
+        self._best_latency = None
+        self._completed = 0
+
+    def run(self, func, jobs):
+        """
+        Call the supplied function with the argument of each job.
+
+        :param func: The function to call
+        :param list jobs: A list of (size in bytes, argument) tuples
+
+        :return: The list of the results of the calls, in the order of the
+            jobs.
+        """
+        self._jobs = jobs
+        self._results = [None] * len(jobs)
+        self._priority_queue = deque()
+        self._queue = deque()
+        for (index, (size, _)) in enumerate(jobs):
+            if size < self._priority_size:
+                self._priority_queue.append(index)
+            else:
+                self._queue.append(index)
+
+        self._func = func
+        workers = min(self._workers, len(jobs))
+        if workers <= 1:
+            self._work()
+            return self._results
+
+        threads = [threading.Thread(target=self._work) for _ in range(workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self._results
+
+    def _work(self):
+        """
+        Copy files until there are none left.
+        """
+        while True:
+            with self._condition:
+                while (
+                    not self._priority_queue
+                    and self._queue
+                    and self._active >= self._allowed
+                ):
+                    self._condition.wait()
+                if self._priority_queue:
+                    index = self._priority_queue.popleft()
+                    priority = True
+                elif self._queue:
+                    index = self._queue.popleft()
+                    priority = False
+                    self._active += 1
+                else:
+                    return
+
+            (size, argument) = self._jobs[index]
+            start_time = time.time()
+            start_wait = self._get_waited()
+            try:
+                self._results[index] = self._func(argument)
+            finally:
+                if not priority:
+                    seconds = time.time() - start_time
+                    seconds -= self._get_waited() - start_wait
+                    with self._condition:
+                        self._active -= 1
+                        if size:
+                            self._adapt(size, seconds)
+                        self._condition.notify_all()
+
+    def _get_waited(self):
+        """
+        Return the time the current thread waited on the bandwidth limiter.
+        """
+        if self._bandwidth_limiter is None:
+            return 0.0
+        return self._bandwidth_limiter.get_waited()
+
+    def _adapt(self, size, seconds):
+        """
+        Update the copy latency with a finished copy and adjust the number of
+        files allowed to be copied at once. Called with the condition held.
+
+        :param int size: The size of the file copied, in bytes
+        :param float seconds: The time taken to copy the file
+        """
+        latency = seconds / size
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency += _COPY_LATENCY_SMOOTHING * (latency - self._latency)
+        if self._best_latency is None or self._latency < self._best_latency:
+            self._best_latency = self._latency
+
+        # give each change time to show its effect before the next one
+        self._completed += 1
+        if not self._adaptive or self._completed < self._allowed:
+            return
+        self._completed = 0
+
+        allowed = self._allowed
+        if self._latency > self._best_latency * _COPY_BACKOFF_LATENCY_RATIO:
+            allowed = max(1, allowed // 2)
+        elif self._latency < self._best_latency * _COPY_RECOVERY_LATENCY_RATIO:
+            allowed = min(self._workers, allowed + 1)
+
+        if allowed != self._allowed:
+            self.concurrency_changes.append((self._latency, allowed))
+            self._allowed = allowed
+
+
+class _DeferredLogger(object):
+    """
+    Keeps the records logged by a background thread, to be logged from the
+    publisher's thread later on. The publisher's log handler updates its UI
+    and can't be used from other threads.
+    """
+
+    def __init__(self):
+        self._records = []
+        self._lock = threading.Lock()
+
+    def debug(self, message):
+        self._log(logging.DEBUG, message)
+
+    def info(self, message):
+        self._log(logging.INFO, message)
+
+    def warning(self, message):
+        self._log(logging.WARNING, message)
+
+    def error(self, message):
+        self._log(logging.ERROR, message)
+
+    def flush(self, logger):
+        """
+        Log the records kept so far to the supplied logger.
+        """
+        with self._lock:
+            (records, self._records) = (self._records, [])
+        for (level, message) in records:
+            logger.log(level, message)
+
+    def _log(self, level, message):
+        with self._lock:
+            self._records.append((level, message))
+
+
+class _BandwidthLimiter(object):
+    """
+    Paces the copies sharing it so that, on average, no more than a given
+    number of bytes are copied per second.
+    """
+
+    def __init__(self, bytes_per_second):
+        """
+        :param int bytes_per_second: The maximum average bandwidth
+        """
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+        self._waited = threading.local()
+
+    def consume(self, size):
+        """
+        Wait until the supplied number of bytes can be copied without going
+        over the bandwidth limit.
+
+        :param int size: The number of bytes about to be copied
+        """
+        with self._lock:
+            now = time.time()
+            start_time = max(now, self._next_time)
+            self._next_time = start_time + float(size) / self.bytes_per_second
+        if start_time > now:
+            time.sleep(start_time - now)
+            self._waited.seconds = self.get_waited() + start_time - now
+
+    def get_waited(self):
+        """
+        Return the total time the current thread waited in :meth:`consume`.
+        """
+        return getattr(self._waited, "seconds", 0.0)
+
+
+def _get_bandwidth_limiter(bytes_per_second):
+    """
+    Return the bandwidth limiter shared by all the copies of this session
+    limited to the supplied bandwidth.
+    """
+    with _BANDWIDTH_LIMITERS_LOCK:
+        bandwidth_limiter = _BANDWIDTH_LIMITERS.get(bytes_per_second)
+        if bandwidth_limiter is None:
+            bandwidth_limiter = _BandwidthLimiter(bytes_per_second)
+            _BANDWIDTH_LIMITERS[bytes_per_second] = bandwidth_limiter
+        return bandwidth_limiter
+
+
+def _new_hasher(algorithm):
+    """
+    Return a new hash object for the supplied algorithm.
+
+    Algorithms starting with "xxh" (ie. xxh64, xxh3_64, xxh3_128) require the
+    optional ``xxhash`` module. Any other name is passed to ``hashlib``.
+
+    :raises ValueError: If the algorithm is not available.
+    """
+    if algorithm.startswith("xxh"):
+        if xxhash is None:
+            raise ValueError(
+                "The xxhash module is required for the '%s' algorithm" % (algorithm,)
+            )
+        if not hasattr(xxhash, algorithm):
+            raise ValueError("Unsupported xxhash algorithm: %s" % (algorithm,))
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def _file_hash(path, algorithm):
+    """
+    Return the hex digest of the contents of the supplied file.
+    """
+    hasher = _new_hasher(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_COPY_BUFFER_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _copy_data(
+    src, dst, block_size, use_sendfile=True, read_ahead=True, algorithm=None
+):
+    """
+    Copy ``src`` to ``dst`` in blocks of the supplied size.
+
+    :param str src: The file to copy
+    :param str dst: The destination of the copy
+    :param int block_size: The number of bytes copied at a time
+    :param bool use_sendfile: Whether the kernel can copy the data with
+        sendfile when no checksum is computed
+    :param bool read_ahead: Whether to advise the kernel to read ahead of the
+        copy
+    :param str algorithm: The checksum algorithm to compute the checksum of
+        the data with as it is copied, or None.
+
+    :return: The hex digest of the copied data, or None.
+    """
+    hasher = _new_hasher(algorithm) if algorithm else None
+
+    with open(src, "rb") as src_file:
+        src_fd = src_file.fileno()
+        if read_ahead and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_WILLNEED)
+
+        with open(dst, "wb") as dst_file:
+            copied = 0
+            if hasher is None and use_sendfile and _USE_SENDFILE:
+                size = os.fstat(src_fd).st_size
+                try:
+                    while copied < size:
+                        sent = os.sendfile(
+                            dst_file.fileno(),
+                            src_fd,
+                            copied,
+                            min(block_size, size - copied),
+                        )
+                        if not sent:
+                            break
+                        copied += sent
+                except OSError:
+                    # sendfile isn't supported by every filesystem. only fall
+                    # back before any data has been written.
+                    if copied:
+                        raise
+                if copied:
+                    src_file.seek(copied)
+
+            buffer = bytearray(block_size)
+            view = memoryview(buffer)
+            while True:
+                read = src_file.readinto(buffer)
+                if not read:
+                    break
+                if hasher:
+                    hasher.update(view[:read])
+                dst_file.write(view[:read])
+
+    # match the permissions set by sgtk's copy_file
+    os.chmod(dst, 0o666)
+
+    return hasher.hexdigest() if hasher else None
+
+
+def _sync_files(paths):
+    """
+    Flush the supplied files, and the folders listing them, to the storage.
+
+    Where available, each filesystem is flushed with a single syncfs call
+    rather than syncing every file.
+    """
+    folders = {}
+    for path in paths:
+        folders.setdefault(os.path.dirname(path), []).append(path)
+
+    synced_devices = set()
+    for (folder, folder_paths) in folders.items():
+        if _syncfs is not None:
+            folder_fd = os.open(folder, os.O_RDONLY)
+            try:
+                device = os.fstat(folder_fd).st_dev
+                if device in synced_devices:
+                    continue
+                if _syncfs(folder_fd) == 0:
+                    synced_devices.add(device)
+                    continue
+            finally:
+                os.close(folder_fd)
+
+        for path in folder_paths:
+            fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        if hasattr(os, "O_DIRECTORY"):
+            # persist the folder entries too. not possible on windows.
+            folder_fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(folder_fd)
+            finally:
+                os.close(folder_fd)
+
+
+def _transfer_file(mode, src, dst):
+    """
+    Transfer ``src`` to ``dst`` with one of the non-copy transfer modes.
+
+    :param str mode: One of "hardlink", "reflink" or "copy_file_range"
+    :param str src: The file to transfer
+    :param str dst: The destination of the transfer
+
+    :raises OSError: If the mode is not supported for the supplied paths.
+    """
+
+    if mode == "hardlink":
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+        # don't touch the permissions here, the data is shared with the source
+        return
+
+    with open(src, "rb") as src_file:
+        with open(dst, "wb") as dst_file:
+            if mode == "reflink":
+                if fcntl is None:
+                    raise OSError(errno.ENOSYS, "reflink is not available")
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+            elif mode == "copy_file_range":
+                if not hasattr(os, "copy_file_range"):
+                    raise OSError(errno.ENOSYS, "copy_file_range is not available")
+                remaining = os.fstat(src_file.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(
+                        src_file.fileno(), dst_file.fileno(), remaining
+                    )
+                    if not copied:
+                        break
+                    remaining -= copied
+                if remaining > 0:
+                    # the source shrank or the copy stopped short. let the
+                    # regular copy take over rather than publish a truncated
+                    # file.
+                    raise OSError(
+                        errno.EIO,
+                        "copy_file_range stopped with %s bytes left" % (remaining,),
+                    )
+            else:
+                raise ValueError("Unknown transfer mode: %s" % (mode,))
+
+    # match the permissions set by sgtk's copy_file
+    os.chmod(dst, 0o666)
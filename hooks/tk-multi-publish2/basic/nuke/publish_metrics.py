@@ -0,0 +1,251 @@
+# Copyright (c) 2017 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import datetime
+import json
+import os
+import socket
+import threading
+import time
+
+import sgtk
+
+HookBaseClass = sgtk.get_hook_baseclass()
+
+# serializes writes to the metrics logs across the plugins' threads
+_LOG_LOCK = threading.Lock()
+
+
+class PublishMetrics(HookBaseClass):
+    """
+    Hook used by the publish plugins to measure their phases and steps.
+
+    The plugins time each accept, validate, publish and finalize phase with
+    :meth:`measure`, and the steps within them (template resolution, copy,
+    register_publish, upload...) with :meth:`step`. Each finished measurement
+    is handed to :meth:`emit` as a dictionary of the form::
+
+        {
+            "time": "2020-01-01T12:00:00.000000",
+            "host": "workstation01",
+            "plugin": "Publish to Shotgun",
+            "phase": "publish",
+            "step": "copy",  # None for the phase itself
+            "item": "comp_v001.%04d.exr (Write1)",
+            "path": "/path/to/comp_v001.%04d.exr",
+            "project": "Big Buck Bunny",
+            "duration": 12.5,  # seconds
+            "bytes": 1073741824,
+            "frames": 100,
+            "sg_calls": 2,  # Shotgun round-trips
+            "error": None,  # the exception type if the measured code raised
+        }
+
+    The counters of a step are added to the phase it belongs to.
+
+    This implementation appends each record as a line of json to the file set
+    by the plugins' "Metrics Log" setting. Override :meth:`emit` to send the
+    records somewhere else.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PublishMetrics, self).__init__(*args, **kwargs)
+
+        # the measurement each thread is currently adding to
+        self._current = threading.local()
+
+    def measure(self, settings, plugin, phase, item):
+        """
+        Return a measurement of a phase of the supplied plugin, written to the
+        plugin's "Metrics Log", to be used as a context manager around the
+        phase.
+
+        :param settings: The configured settings of the plugin
+        :param plugin: The plugin being measured
+        :param str phase: The plugin phase being measured
+        :param item: The item being processed
+
+        :return: A :class:`Measurement` instance
+        """
+        return self.start(settings["Metrics Log"].value, plugin.name, phase, item)
+
+    def start(self, metrics_log, plugin_name, phase, item):
+        """
+        Return a measurement of a phase of a publish plugin, to be used as a
+        context manager around the code to measure.
+
+        :param str metrics_log: The path of the file to write the records to,
+            passed on to :meth:`emit`
+        :param str plugin_name: The name of the plugin being measured
+        :param str phase: The plugin phase being measured
+        :param item: The item being processed
+
+        :return: A :class:`Measurement` instance
+        """
+
+        project = item.context.project if item.context else None
+        record = {
+            "host": socket.gethostname(),
+            "plugin": plugin_name,
+            "phase": phase,
+            "step": None,
+            "item": item.name,
+            "path": item.properties.get("path"),
+            "project": project.get("name") if project else None,
+        }
+        return Measurement(self, metrics_log, record)
+
+    def step(self, name):
+        """
+        Return a measurement of a step of the phase or step being measured in
+        the current thread, to be used as a context manager around the code to
+        measure.
+
+        :param str name: The name of the step
+
+        :return: A :class:`Measurement` instance
+        """
+
+        parent = self.current()
+        if parent is None:
+            # not within a phase, nothing to attach the step to
+            record = {
+                "host": socket.gethostname(),
+                "plugin": None,
+                "phase": None,
+                "step": name,
+                "item": None,
+                "path": None,
+                "project": None,
+            }
+            return Measurement(self, None, record)
+
+        return Measurement(
+            self, parent.metrics_log, dict(parent.record, step=name), parent
+        )
+
+    def add(self, bytes=0, frames=0, sg_calls=0):
+        """
+        Add to the counters of the measurement of the current thread, if any.
+
+        :param int bytes: The number of bytes processed
+        :param int frames: The number of files or frames processed
+        :param int sg_calls: The number of Shotgun calls made
+        """
+        measurement = self.current()
+        if measurement is not None:
+            measurement.add(bytes=bytes, frames=frames, sg_calls=sg_calls)
+
+    def current(self):
+        """
+        Return the measurement of the current thread, or None.
+        """
+        return getattr(self._current, "measurement", None)
+
+    def attach(self, measurement):
+        """
+        Make the supplied measurement the current one of the calling thread,
+        so that work handed over to a background thread is accounted to the
+        phase that started it.
+
+        :param measurement: A :class:`Measurement` instance or None
+        """
+        self._current.measurement = measurement
+
+    def emit(self, metrics_log, record):
+        """
+        Output a finished measurement.
+
+        :param str metrics_log: The path of the json lines file to append the
+            record to. Environment variables and ``~`` are expanded. Nothing is
+            written if empty.
+        :param dict record: The measurement
+        """
+
+        self.logger.debug(
+            "%s %s%s: %.3fs, %s frames, %s bytes, %s Shotgun calls"
+            % (
+                record["plugin"],
+                record["phase"],
+                " (%s)" % (record["step"],) if record["step"] else "",
+                record["duration"],
+                record["frames"],
+                record["bytes"],
+                record["sg_calls"],
+            )
+        )
+
+        if not metrics_log:
+            return
+
+        metrics_log = os.path.expanduser(os.path.expandvars(metrics_log))
+        line = json.dumps(record) + "\n"
+        try:
+            with _LOG_LOCK:
+                with open(metrics_log, "a") as log_file:
+                    log_file.write(line)
+        except (IOError, OSError) as e:
+            # never fail a publish because of the metrics
+            self.logger.debug(
+                "Unable to write to metrics log %s: %s" % (metrics_log, e)
+            )
+
+
+class Measurement(object):
+    """
+    Context manager timing a phase or step of a publish plugin.
+
+    The measurement is the current one of the thread entering it until it is
+    exited.
+    """
+
+    def __init__(self, metrics_hook, metrics_log, record, parent=None):
+        """
+        :param metrics_hook: The :class:`PublishMetrics` hook to emit to
+        :param str metrics_log: The metrics log passed on to the hook
+        :param dict record: The identifying fields of the measurement
+        :param parent: The measurement to add the counters of this one to
+        """
+        self.metrics_log = metrics_log
+        self.record = dict(record, bytes=0, frames=0, sg_calls=0)
+        self._metrics_hook = metrics_hook
+        self._parent = parent
+        self._previous = None
+        self._lock = threading.Lock()
+        self._start_time = None
+
+    def __enter__(self):
+        self._previous = self._metrics_hook.current()
+        self._metrics_hook.attach(self)
+        self._start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._metrics_hook.attach(self._previous)
+        self.record["time"] = datetime.datetime.now().isoformat()
+        self.record["duration"] = time.time() - self._start_time
+        self.record["error"] = exc_type.__name__ if exc_type else None
+        if self._parent:
+            self._parent.add(
+                bytes=self.record["bytes"],
+                frames=self.record["frames"],
+                sg_calls=self.record["sg_calls"],
+            )
+        self._metrics_hook.emit(self.metrics_log, self.record)
+        return False
+
+    def add(self, bytes=0, frames=0, sg_calls=0):
+        """
+        Add to the counters of the measurement.
+        """
+        with self._lock:
+            self.record["bytes"] += bytes
+            self.record["frames"] += frames
+            self.record["sg_calls"] += sg_calls
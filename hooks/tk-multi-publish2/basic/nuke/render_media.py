@@ -9,10 +9,17 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import sgtk
+import multiprocessing
 import os
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
 import nuke
 
+from collections import deque
+from sgtk.platform.qt import QtCore
 from tank_vendor import six
 
 HookBaseClass = sgtk.get_hook_baseclass()
@@ -21,8 +28,25 @@ HookBaseClass = sgtk.get_hook_baseclass()
 class RenderMedia(HookBaseClass):
     """
     RenderMedia hook implementation for the tk-nuke engine.
+
+    Long frame ranges can be rendered in parallel: the range is split in chunks
+    of ``render_chunk_size`` frames, rendered to an intermediate image sequence
+    by background ``nuke -x`` processes, and the movie is then encoded from
+    that sequence in the session. Set the ``render_chunk_size`` and
+    ``render_chunk_processes`` settings of the app in the environment to turn
+    it on, or ``CHUNK_SIZE`` and ``CHUNK_PROCESSES`` in a derived hook.
     """
 
+    # Frames rendered by each background Nuke process, unless the app's
+    # render_chunk_size setting is set. 0 renders the whole movie in the
+    # session.
+    CHUNK_SIZE = 0
+
+    # Maximum number of background Nuke processes rendering at the same time,
+    # unless the app's render_chunk_processes setting is set. 0 runs one per 8
+    # cores.
+    CHUNK_PROCESSES = 0
+
     def __init__(self, *args, **kwargs):
         super(RenderMedia, self).__init__(*args, **kwargs)
 
@@ -44,6 +68,12 @@ class RenderMedia(HookBaseClass):
         else:
             self._logo = ""
 
+        # the chunks the frames are rendered in, if any
+        self._chunk_size = self.__app.get_setting("render_chunk_size", self.CHUNK_SIZE)
+        self._chunk_processes = self.__app.get_setting(
+            "render_chunk_processes", self.CHUNK_PROCESSES
+        )
+
         # now transform paths to be forward slashes, otherwise it wont work on windows.
         if sgtk.util.is_windows():
             self._font = self._font.replace(os.sep, "/")
@@ -78,6 +108,17 @@ class RenderMedia(HookBaseClass):
         :returns:               Location of the rendered media
         :rtype:                 str
         """
+        if self._chunk_size and last_frame - first_frame >= self._chunk_size:
+            return self.__render_in_chunks(
+                input_path,
+                output_path,
+                width,
+                height,
+                first_frame,
+                last_frame,
+                color_space,
+            )
+
         output_node = None
         ctx = self.__app.context
 
@@ -87,20 +128,9 @@ class RenderMedia(HookBaseClass):
         # now operate inside this group
         group.begin()
         try:
-            # create read node
-            read = nuke.nodes.Read(name="source", file=input_path.replace(os.sep, "/"))
-            read["on_error"].setValue("black")
-            read["first"].setValue(first_frame)
-            read["last"].setValue(last_frame)
-            if color_space:
-                read["colorspace"].setValue(color_space)
-
-            # now create the slate/burnin node
-    
-
-            # create a scale node
-            scale = self.__create_scale_node(width, height)
-            scale.setInput(0, read)
+            scale = self.__create_source_nodes(
+                input_path, width, height, first_frame, last_frame, color_space
+            )
 
             # Create the output node
             output_node = self.__create_output_node(output_path)
@@ -123,6 +153,158 @@ class RenderMedia(HookBaseClass):
 
         return output_path
 
+    def __render_in_chunks(
+        self,
+        input_path,
+        output_path,
+        width,
+        height,
+        first_frame,
+        last_frame,
+        color_space,
+    ):
+        """
+        Render the frames in chunks in parallel background Nuke processes, then
+        encode the movie from the rendered frames.
+
+        :param str input_path:      Path to the input frames for the movie
+        :param str output_path:     Path to the output movie that will be rendered
+        :param int width:           Width of the output movie
+        :param int height:          Height of the output movie
+        :param int first_frame:     The first frame of the sequence of frames.
+        :param int last_frame:      The last frame of the sequence of frames.
+        :param str color_space:     Colorspace of the input frames
+
+        :returns:               Location of the rendered media
+        :rtype:                 str
+        """
+        temp_folder = tempfile.mkdtemp(prefix="tk_review_")
+        try:
+            frames_path = os.path.join(temp_folder, "frame.%06d.exr")
+            frames_path = frames_path.replace(os.sep, "/")
+            script_path = os.path.join(temp_folder, "review.nk")
+
+            # save the script with the nodes rendering the frames for the
+            # background processes. the frames are written without colorspace
+            # conversion and read back the same way for the encode.
+            group = nuke.nodes.Group()
+            group.begin()
+            try:
+                scale = self.__create_source_nodes(
+                    input_path, width, height, first_frame, last_frame, color_space
+                )
+                frames_node = nuke.nodes.Write(file=frames_path, file_type="exr")
+                frames_node["raw"].setValue(True)
+                frames_node.setInput(0, scale)
+            finally:
+                group.end()
+            try:
+                frames_node_name = frames_node.fullName()
+                nuke.scriptSaveToTemp(script_path)
+            finally:
+                nuke.delete(group)
+
+            chunks = [
+                (chunk_first, min(chunk_first + self._chunk_size - 1, last_frame))
+                for chunk_first in range(first_frame, last_frame + 1, self._chunk_size)
+            ]
+            cpu_count = multiprocessing.cpu_count()
+            processes = self._chunk_processes or max(1, cpu_count // 8)
+            self.__app.log_info(
+                "Rendering %s frames in %s chunks, %s at a time..."
+                % (last_frame - first_frame + 1, len(chunks), processes)
+            )
+
+            # render in a thread with our own event loop to wait for it, so
+            # that the UI remains responsive
+            thread = ChunkRenderThread(
+                script_path,
+                frames_node_name,
+                chunks,
+                processes,
+                max(1, cpu_count // processes),
+                temp_folder,
+            )
+            if nuke.GUI:
+                event_loop = QtCore.QEventLoop()
+                thread.finished.connect(event_loop.quit)
+                thread.start()
+                event_loop.exec_()
+            else:
+                thread.run()
+
+            errors = thread.get_errors()
+            if errors:
+                raise Exception(
+                    "Unable to render the frames of the movie:\n%s"
+                    % ("\n".join(errors),)
+                )
+
+            # encode the movie
+            output_node = None
+            group = nuke.nodes.Group()
+            group.begin()
+            try:
+                read = nuke.nodes.Read(name="frames", file=frames_path)
+                read["raw"].setValue(True)
+                read["first"].setValue(first_frame)
+                read["last"].setValue(last_frame)
+
+                output_node = self.__create_output_node(output_path)
+                output_node.setInput(0, read)
+            finally:
+                group.end()
+
+            if output_node:
+                # Make sure the output folder exists
+                output_folder = os.path.dirname(output_path)
+                self.__app.ensure_folder_exists(output_folder)
+
+                # Render the outputs, first view only
+                nuke.executeMultiple(
+                    [output_node],
+                    ([first_frame - 1, last_frame, 1],),
+                    [nuke.views()[0]],
+                )
+
+            # Cleanup after ourselves
+            nuke.delete(group)
+        finally:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+        return output_path
+
+    def __create_source_nodes(
+        self, input_path, width, height, first_frame, last_frame, color_space
+    ):
+        """
+        Create the Nuke nodes reading and scaling the input frames.
+
+        :param str input_path:      Path to the input frames for the movie
+        :param int width:           Width of the output movie
+        :param int height:          Height of the output movie
+        :param int first_frame:     The first frame of the sequence of frames.
+        :param int last_frame:      The last frame of the sequence of frames.
+        :param str color_space:     Colorspace of the input frames
+
+        :returns:               The last node of the chain
+        :rtype:                 Nuke node
+        """
+        # create read node
+        read = nuke.nodes.Read(name="source", file=input_path.replace(os.sep, "/"))
+        read["on_error"].setValue("black")
+        read["first"].setValue(first_frame)
+        read["last"].setValue(last_frame)
+        if color_space:
+            read["colorspace"].setValue(color_space)
+
+        # now create the slate/burnin node
+
+        # create a scale node
+        scale = self.__create_scale_node(width, height)
+        scale.setInput(0, read)
+        return scale
+
     def __create_scale_node(self, width, height):
         """
         Create the Nuke scale node to resize the content.
@@ -215,3 +397,94 @@ class RenderMedia(HookBaseClass):
 
         return settings
 
+
+class ChunkRenderThread(QtCore.QThread):
+    """
+    Worker thread running the background Nuke processes that render the chunks
+    of frames of a movie, at most a given number at a time. Broken out of the
+    main loop so that the UI can remain responsive while rendering.
+    """
+
+    def __init__(self, script_path, node_name, chunks, processes, threads, log_folder):
+        """
+        :param str script_path: The Nuke script to render
+        :param str node_name:   The full name of the Write node to render
+        :param list chunks:     The (first frame, last frame) of each chunk
+        :param int processes:   Maximum number of processes at the same time
+        :param int threads:     Number of threads of each process
+        :param str log_folder:  Folder to write the output of each process to
+        """
+        QtCore.QThread.__init__(self)
+        self._script_path = script_path
+        self._node_name = node_name
+        self._chunks = chunks
+        self._processes = processes
+        self._threads = threads
+        self._log_folder = log_folder
+        self._errors = []
+
+    def get_errors(self):
+        """
+        Returns the errors of the chunks that failed to render.
+
+        :returns:   List of errors
+        :rtype:     [str]
+        """
+        return self._errors
+
+    def run(self):
+        """
+        Render the chunks, stopping at the first failure.
+        """
+        pending = deque(self._chunks)
+        running = []
+        try:
+            while pending or running:
+                while pending and len(running) < self._processes:
+                    running.append(self._start(*pending.popleft()))
+
+                for chunk in list(running):
+                    (process, log_path, first_frame, last_frame) = chunk
+                    if process.poll() is None:
+                        continue
+                    running.remove(chunk)
+                    if process.returncode:
+                        with open(log_path) as log_file:
+                            output = log_file.read()[-2000:]
+                        self._errors.append(
+                            "Frames %s-%s failed with exit code %s:\n%s"
+                            % (first_frame, last_frame, process.returncode, output)
+                        )
+
+                if self._errors:
+                    break
+                time.sleep(0.1)
+        except Exception as e:
+            self._errors.append(str(e))
+        finally:
+            # stop the other chunks after a failure
+            for (process, _, _, _) in running:
+                process.kill()
+                process.wait()
+
+    def _start(self, first_frame, last_frame):
+        """
+        Start the process rendering the supplied frames.
+        """
+        log_path = os.path.join(self._log_folder, "frames_%s.log" % (first_frame,))
+        command = [
+            nuke.EXE_PATH,
+            "-x",
+            "-m",
+            str(self._threads),
+            "-X",
+            self._node_name,
+            "-F",
+            "%s-%s" % (first_frame, last_frame),
+            self._script_path,
+        ]
+        with open(log_path, "w") as log_file:
+            process = subprocess.Popen(
+                command, stdout=log_file, stderr=subprocess.STDOUT
+            )
+        return (process, log_path, first_frame, last_frame)
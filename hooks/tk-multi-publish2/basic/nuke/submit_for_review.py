@@ -74,7 +74,9 @@ class NukeSubmitForReviewPlugin(HookBaseClass):
         The type string should be one of the data types that toolkit accepts
         as part of its environment configuration.
         """
-        return {}
+
+        # the base settings include the metrics settings
+        return super(NukeSubmitForReviewPlugin, self).settings or {}
 
     @property
     def item_filters(self):
@@ -87,6 +89,7 @@ class NukeSubmitForReviewPlugin(HookBaseClass):
         """
         return ["*.sequence"]
 
+    @HookBaseClass.measured("accept")
     def accept(self, settings, item):
         """
         Method called by the publisher to determine if an item is of any
@@ -163,6 +166,7 @@ class NukeSubmitForReviewPlugin(HookBaseClass):
             )
         return {"accepted": accepted, "checked": True}
 
+    @HookBaseClass.measured("validate")
     def validate(self, settings, item):
         """
         Validates the given item to check that it is ok to publish. Returns a
@@ -193,6 +197,7 @@ class NukeSubmitForReviewPlugin(HookBaseClass):
 
         return True
 
+    @HookBaseClass.measured("publish")
     def publish(self, settings, item):
         """
         Executes the publish logic for the given item and settings.
@@ -230,29 +235,36 @@ class NukeSubmitForReviewPlugin(HookBaseClass):
                 "'publish_template' property not found on item. "
                 "Review submission for '%' failed." % render_path
             )
-        if not render_template.validate(render_path):
-            raise Exception(
-                "'%s' did not match the render template. "
-                "Review submission failed." % render_path
-            )
-#
-        render_path_fields = render_template.get_fields(render_path)
+        # the collector hands over the fields of the render path
+        render_path_fields = item.properties.get("work_fields")
+        if render_path_fields is None:
+            if not render_template.validate(render_path):
+                raise Exception(
+                    "'%s' did not match the render template. "
+                    "Review submission failed." % render_path
+                )
+            render_path_fields = render_template.get_fields(render_path)
+        render_path_fields = dict(render_path_fields)
         first_frame = item.properties.get("first_frame")
         last_frame = item.properties.get("last_frame")
         colorspace = item.properties.get("color_space")
 
-        version = review_submission_app.render_and_submit_version(
-            publish_template,
-            render_path_fields,
-            first_frame,
-            last_frame,
-            [sg_publish_data],
-            sg_task,
-            comment,
-            thumbnail_path,
-            progress_cb,
-            colorspace,
-        )
+        metrics = self._get_metrics(settings)
+        with metrics.step("render_and_submit"):
+            version = review_submission_app.render_and_submit_version(
+                publish_template,
+                render_path_fields,
+                first_frame,
+                last_frame,
+                [sg_publish_data],
+                sg_task,
+                comment,
+                thumbnail_path,
+                progress_cb,
+                colorspace,
+            )
+            if first_frame is not None and last_frame is not None:
+                metrics.add(frames=last_frame - first_frame + 1)
         if version:
             self.logger.info(
                 "Version uploaded for file: %s" % (render_path,),
@@ -270,6 +282,7 @@ class NukeSubmitForReviewPlugin(HookBaseClass):
                 "submit the review associated sequence."
             )
 
+    @HookBaseClass.measured("finalize")
     def finalize(self, settings, item):
         """
         Execute the finalization pass. This pass executes once all the publish
@@ -85,7 +85,8 @@ class UploadVersionPlugin(HookBaseClass):
         The type string should be one of the data types that toolkit accepts as
         part of its environment configuration.
         """
-        return {
+        # settings specific to this plugin
+        upload_settings = {
             "File Extensions": {
                 "type": "str",
                 "default": "jpeg, jpg, png, mov, mp4, pdf",
@@ -103,6 +104,11 @@ class UploadVersionPlugin(HookBaseClass):
             },
         }
 
+        # update the base settings, which include the metrics settings
+        plugin_settings = super(UploadVersionPlugin, self).settings or {}
+        plugin_settings.update(upload_settings)
+        return plugin_settings
+
     @property
     def item_filters(self):
         """
@@ -116,6 +122,7 @@ class UploadVersionPlugin(HookBaseClass):
         # we use "video" since that's the mimetype category.
         return ["file.image", "file.video"]
 
+    @HookBaseClass.measured("accept")
     def accept(self, settings, item):
         """
         Method called by the publisher to determine if an item is of any
@@ -172,6 +179,7 @@ class UploadVersionPlugin(HookBaseClass):
             )
             return {"accepted": False}
 
+    @HookBaseClass.measured("validate")
     def validate(self, settings, item):
         """
         Validates the given item to check that it is ok to publish.
@@ -187,6 +195,7 @@ class UploadVersionPlugin(HookBaseClass):
         """
         return True
 
+    @HookBaseClass.measured("publish")
     def publish(self, settings, item):
         """
         Executes the publish logic for the given item and settings.
@@ -269,8 +278,12 @@ class UploadVersionPlugin(HookBaseClass):
             },
         )
 
+        metrics = self._get_metrics(settings)
+
         # Create the version
-        version = publisher.shotgun.create("Version", version_data)
+        with metrics.step("create_version"):
+            version = publisher.shotgun.create("Version", version_data)
+            metrics.add(sg_calls=1)
         self.logger.info("Version created!")
 
         # stash the version info in the item just in case
@@ -288,17 +301,22 @@ class UploadVersionPlugin(HookBaseClass):
             else:
                 upload_path = path
 
-            self.parent.shotgun.upload(
-                "Version", version["id"], upload_path, "sg_uploaded_movie"
-            )
+            with metrics.step("upload"):
+                self.parent.shotgun.upload(
+                    "Version", version["id"], upload_path, "sg_uploaded_movie"
+                )
+                metrics.add(bytes=os.path.getsize(upload_path), frames=1, sg_calls=1)
         elif thumb:
             # only upload thumb if we are not uploading the content. with
             # uploaded content, the thumb is automatically extracted.
             self.logger.info("Uploading thumbnail...")
-            self.parent.shotgun.upload_thumbnail("Version", version["id"], thumb)
+            with metrics.step("upload_thumbnail"):
+                self.parent.shotgun.upload_thumbnail("Version", version["id"], thumb)
+                metrics.add(bytes=os.path.getsize(thumb), sg_calls=1)
 
         self.logger.info("Upload complete!")
 
+    @HookBaseClass.measured("finalize")
     def finalize(self, settings, item):
         """
         Execute the finalization pass. This pass executes once all the publish
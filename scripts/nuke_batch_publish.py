@@ -0,0 +1,412 @@
+# Copyright (c) 2017 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Publish the outputs of many Nuke scripts without a GUI.
+
+Each script is opened in its own ``nuke -t`` process, which starts the tk-nuke
+engine in the context of the script and runs the collect, validate, publish and
+finalize phases of the publisher as configured for the engine. The collector
+collects every output of the script when Nuke runs without a GUI. At most
+``--workers`` scripts are published at the same time::
+
+    python scripts/nuke_batch_publish.py --nuke /usr/local/Nuke13.2v4/Nuke13.2 \\
+        --workers 8 --log-dir /tmp/republish /mnt/projects/*/comp/work/*.nk
+
+The text of each script is read first, and scripts without a Read, Write or
+WriteGeo node whose file matches the render template of the configuration are
+skipped without starting Nuke. The plates read by a script aren't published.
+
+Toolkit authenticates as the default user of the configuration, ie. the script
+user set in its shotgun.yml or the saved login of the user running the batch.
+The output of each Nuke process is written to a log file per script, and the
+results of all the scripts are summarized at the end.
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from multiprocessing.pool import ThreadPool
+
+logger = logging.getLogger("nuke_batch_publish")
+
+# the pipeline configuration this script belongs to
+CONFIG_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the types of the nodes the collector publishes the outputs of
+OUTPUT_NODE_TYPES = ("Read", "Write", "WriteGeo")
+
+# the template the outputs published by the collector match
+RENDER_TEMPLATE_NAME = "nuke_render_publish"
+
+# the worker reports its result on a line starting with this
+RESULT_PREFIX = "BATCH_PUBLISH_RESULT: "
+
+# the first line of a node in the text of a script, ie. "Write {"
+_NODE_START_REGEX = re.compile(r"^(\w+) \{\s*$")
+
+# a knob of a node and its value, quoted or not
+_KNOB_REGEX = re.compile(r'^\s+(\w+)\s+(?:"((?:[^"\\]|\\.)*)"|(\S+))')
+
+
+################################################################################
+# batch
+
+
+def find_script_outputs(script_path, render_template=None):
+    """
+    Find the output nodes in the text of the supplied Nuke script, without
+    Nuke.
+
+    :param str script_path: The path of the .nk script
+    :param render_template: The template the outputs collected by the
+        collector match, or None to find every output node. Files with
+        expressions, which only Nuke can evaluate, are always kept.
+    :return: A list of (node type, node name, file) tuples. The file knobs are
+        returned as written in the script, expressions are not evaluated.
+    """
+    outputs = []
+    node = None
+    with io.open(script_path, encoding="utf-8", errors="replace") as script_file:
+        for line in script_file:
+            if node is None:
+                match = _NODE_START_REGEX.match(line)
+                if match and match.group(1) in OUTPUT_NODE_TYPES:
+                    node = {"type": match.group(1), "name": None, "file": None}
+            elif line.startswith("}"):
+                if node["file"] and _may_match(render_template, node["file"]):
+                    outputs.append((node["type"], node["name"], node["file"]))
+                node = None
+            else:
+                match = _KNOB_REGEX.match(line)
+                if match and match.group(1) in ("name", "file"):
+                    node[match.group(1)] = match.group(2) or match.group(3)
+    return outputs
+
+
+def load_render_template(core_python):
+    """
+    Load the render template of this configuration with the toolkit core.
+
+    :param str core_python: The folder of the toolkit core python modules
+    :return: The template, or None if it can't be loaded
+    """
+    if core_python and core_python not in sys.path:
+        sys.path.append(core_python)
+    try:
+        import sgtk
+
+        tk = sgtk.sgtk_from_path(CONFIG_FOLDER)
+    except Exception as e:
+        logger.warning(
+            "Unable to load the templates of %s, the outputs of the scripts "
+            "won't be checked before starting Nuke: %s" % (CONFIG_FOLDER, e)
+        )
+        return None
+    return tk.templates.get(RENDER_TEMPLATE_NAME)
+
+
+def _may_match(template, path):
+    """
+    Return whether the supplied file knob may match the template once
+    evaluated by Nuke.
+    """
+    if template is None or "[" in path or "$" in path:
+        return True
+    return template.validate(path)
+
+
+def publish_script(options, index, script_path):
+    """
+    Publish the outputs of a script in a Nuke process.
+
+    :param options: The parsed command line options
+    :param int index: The index of the script in the batch, to name its log
+    :param str script_path: The path of the .nk script
+    :return: A dictionary with the result of the publish
+    """
+    result = {
+        "script": script_path,
+        "status": "failed",
+        "outputs": 0,
+        "items": 0,
+        "seconds": 0.0,
+        "error": None,
+        "log": None,
+    }
+    start = time.time()
+
+    try:
+        outputs = find_script_outputs(script_path, options.render_template)
+    except (IOError, OSError) as e:
+        result["error"] = "Unable to read the script: %s" % (e,)
+        return result
+    result["outputs"] = len(outputs)
+    if not outputs:
+        result["status"] = "skipped"
+        return result
+
+    result["log"] = os.path.join(
+        options.log_dir, "%04d_%s.log" % (index, os.path.basename(script_path))
+    )
+    command = (
+        [options.nuke]
+        + options.nuke_args
+        + ["-t", os.path.abspath(__file__), "--worker", os.path.abspath(script_path)]
+    )
+
+    env = dict(os.environ)
+    if options.core_python:
+        env["PYTHONPATH"] = os.pathsep.join(
+            [options.core_python] + [path for path in [env.get("PYTHONPATH")] if path]
+        )
+
+    timed_out = []
+
+    def kill():
+        timed_out.append(True)
+        process.kill()
+
+    with open(result["log"], "w") as log_file:
+        process = subprocess.Popen(
+            command, stdout=log_file, stderr=subprocess.STDOUT, env=env
+        )
+        timer = None
+        if options.timeout:
+            timer = threading.Timer(options.timeout, kill)
+            timer.start()
+        try:
+            process.wait()
+        finally:
+            if timer:
+                timer.cancel()
+    result["seconds"] = time.time() - start
+
+    # the worker prints its result last
+    with io.open(result["log"], encoding="utf-8", errors="replace") as log_file:
+        for line in log_file:
+            if line.startswith(RESULT_PREFIX):
+                result.update(json.loads(line[len(RESULT_PREFIX) :]))
+
+    if timed_out:
+        result["status"] = "timeout"
+        result["error"] = "Killed after %s seconds" % (options.timeout,)
+    elif result["status"] == "failed" and not result["error"]:
+        result["error"] = "Nuke exited with code %s" % (process.returncode,)
+    return result
+
+
+def run_batch(options, script_paths):
+    """
+    Publish the supplied scripts, at most ``options.workers`` at a time.
+
+    :return: The list of the results of the scripts, in completion order
+    """
+    pool = ThreadPool(options.workers)
+    results = []
+    try:
+        for result in pool.imap_unordered(
+            lambda job: publish_script(options, *job), enumerate(script_paths)
+        ):
+            results.append(result)
+            logger.info(
+                "[%s/%s] %s %s in %.1fs%s"
+                % (
+                    len(results),
+                    len(script_paths),
+                    result["status"],
+                    result["script"],
+                    result["seconds"],
+                    ": %s" % (result["error"],) if result["error"] else "",
+                )
+            )
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def print_summary(results):
+    statuses = {}
+    for result in results:
+        statuses.setdefault(result["status"], []).append(result)
+
+    print("%-10s %8s" % ("status", "scripts"))
+    for status in sorted(statuses):
+        print("%-10s %8s" % (status, len(statuses[status])))
+
+    for status in ("failed", "timeout"):
+        for result in statuses.get(status, []):
+            print(
+                "%s: %s (log: %s)" % (result["script"], result["error"], result["log"])
+            )
+
+
+################################################################################
+# worker, in nuke
+
+
+def run_worker(script_path):
+    """
+    Publish the outputs of the supplied script and print the result. Runs in
+    ``nuke -t``.
+
+    :return: The exit code of the process
+    """
+    result = {"status": "failed", "items": 0, "error": None}
+    try:
+        result["items"] = _publish_session(script_path)
+        result["status"] = "published"
+    except Exception as e:
+        traceback.print_exc()
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+
+    sys.stdout.write("\n%s%s\n" % (RESULT_PREFIX, json.dumps(result)))
+    sys.stdout.flush()
+    return 0 if result["status"] == "published" else 1
+
+
+def _publish_session(script_path):
+    """
+    Open the script, start the engine in its context and run the publisher.
+
+    :return: The number of items collected
+    """
+    import nuke
+    import sgtk
+
+    authenticator = sgtk.authentication.ShotgunAuthenticator(
+        sgtk.util.CoreDefaultsManager()
+    )
+    sgtk.set_authenticated_user(authenticator.get_default_user())
+
+    tk = sgtk.sgtk_from_path(script_path)
+    context = tk.context_from_path(script_path)
+    nuke.scriptOpen(script_path)
+    engine = sgtk.platform.start_engine("tk-nuke", tk, context)
+    try:
+        publisher = engine.apps.get("tk-multi-publish2")
+        if publisher is None:
+            raise Exception("The publisher isn't configured in %s." % (context,))
+
+        manager = publisher.create_publish_manager()
+        items = manager.collect_session()
+        if not items:
+            return 0
+
+        failures = manager.validate()
+        if failures:
+            raise Exception(
+                "%s tasks failed to validate: %s"
+                % (len(failures), "; ".join(str(error) for (task, error) in failures))
+            )
+        manager.publish()
+        manager.finalize()
+        return len(items)
+    finally:
+        engine.destroy()
+
+
+################################################################################
+# command line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scripts", nargs="*", help="The Nuke scripts to publish")
+    parser.add_argument(
+        "--file-list", help="A text file with the path of a script to publish per line"
+    )
+    parser.add_argument(
+        "--nuke",
+        default=os.environ.get("NUKE_EXECUTABLE"),
+        help="The Nuke executable (default: $NUKE_EXECUTABLE)",
+    )
+    parser.add_argument(
+        "--nuke-args",
+        type=shlex.split,
+        default=[],
+        help="Extra arguments passed to Nuke, ie. --nuke-args=--nukex",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of scripts published at the same time (default: 4)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=0,
+        help="Seconds after which the publish of a script is stopped (default: none)",
+    )
+    parser.add_argument(
+        "--log-dir", help="Folder to write the log of each script to (default: temp)"
+    )
+    parser.add_argument(
+        "--core-python",
+        default=os.path.join(CONFIG_FOLDER, "install", "core", "python"),
+        help="Folder of the toolkit core python modules, added to the PYTHONPATH "
+        "of Nuke (default: the core installed in this configuration)",
+    )
+    parser.add_argument("--json", help="Write the results to this json file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+
+    if options.worker:
+        return run_worker(options.worker)
+
+    script_paths = list(options.scripts)
+    if options.file_list:
+        with open(options.file_list) as file_list:
+            script_paths.extend(line.strip() for line in file_list if line.strip())
+    if not script_paths:
+        parser.error("No scripts to publish")
+    if not options.nuke:
+        parser.error("The Nuke executable must be set with --nuke or $NUKE_EXECUTABLE")
+    if options.workers < 1:
+        parser.error("At least one worker is required")
+    if not os.path.isdir(options.core_python):
+        options.core_python = None
+
+    logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+
+    options.render_template = load_render_template(options.core_python)
+
+    options.log_dir = options.log_dir or tempfile.mkdtemp(prefix="nuke_batch_publish_")
+    if not os.path.isdir(options.log_dir):
+        os.makedirs(options.log_dir)
+    logger.info(
+        "Publishing %s scripts with %s workers, logs in %s"
+        % (len(script_paths), options.workers, options.log_dir)
+    )
+
+    results = run_batch(options, script_paths)
+    print_summary(results)
+
+    if options.json:
+        with open(options.json, "w") as json_file:
+            json.dump(results, json_file, indent=4)
+
+    return 0 if all(r["status"] in ("published", "skipped") for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())